@@ -0,0 +1,140 @@
+"""
+Not Magnus
+Classical chess engine by Devin Zhang
+
+Batched static scores (material and tapered PSQT) of many positions or child moves at once
+With NumPy every score in a batch comes from one gather and sum over piece-square indices,
+without it the same scores are computed one at a time
+"""
+from board import *
+from evaluators import *
+
+
+PADDING = 768 # Feature index that scores nothing, pads rows of the index arrays to the same length
+
+# Signed values from white's point of view of each feature (colored piece on a square) [feature], see feature_index()
+feature_material = [0] * (PADDING + 1)
+feature_mg_psqt = [0] * (PADDING + 1)
+feature_eg_psqt = [0] * (PADDING + 1)
+feature_phase = [0] * (PADDING + 1)
+for color in chess.COLORS:
+    for piece in chess.PIECE_TYPES:
+        for square in chess.SQUARES:
+            feature = feature_index(color, piece, square)
+            feature_material[feature] = MATERIAL[color][piece]
+            feature_mg_psqt[feature] = MG_PSQT[color][piece][square]
+            feature_eg_psqt[feature] = EG_PSQT[color][piece][square]
+            feature_phase[feature] = phase_scores[piece]
+if np is not None:
+    feature_values = np.array([feature_material, feature_mg_psqt, feature_eg_psqt, feature_phase], dtype = np.float64) # [term][feature]
+
+
+def move_features(board, move):
+    """
+    Features removed and added by the move, as two lists of 2 padded with PADDING
+    """
+    color = board.turn
+    from_square = move.from_square
+    to_square = move.to_square
+    piece = board.piece_type_at(from_square)
+    removed = [feature_index(color, piece, from_square), PADDING]
+    added = [feature_index(color, move.promotion or piece, to_square), PADDING]
+
+    if piece == chess.KING and board.is_castling(move):
+        back_rank = from_square & ~7
+        if board.is_kingside_castling(move):
+            king_to, rook_from, rook_to = back_rank + 6, back_rank + 7, back_rank + 5
+        else:
+            king_to, rook_from, rook_to = back_rank + 2, back_rank, back_rank + 3
+        if board.occupied_co[color] & chess.BB_SQUARES[to_square]: # Castling encoded as the king capturing its rook
+            rook_from = to_square
+        added[0] = feature_index(color, chess.KING, king_to)
+        removed[1] = feature_index(color, chess.ROOK, rook_from)
+        added[1] = feature_index(color, chess.ROOK, rook_to)
+    elif board.occupied & chess.BB_SQUARES[to_square]:
+        removed[1] = feature_index(not color, board.piece_type_at(to_square), to_square)
+    elif piece == chess.PAWN and to_square == board.ep_square and (to_square - from_square) % 8:
+        captured_square = to_square - 8 if color == chess.WHITE else to_square + 8
+        removed[1] = feature_index(not color, chess.PAWN, captured_square)
+    return removed, added
+
+
+def board_features(board):
+    """
+    Features of every piece on the board
+    """
+    white = board.occupied_co[chess.WHITE]
+    features = []
+    bb = board.occupied
+    while bb:
+        square = (bb & -bb).bit_length() - 1
+        bb &= bb - 1
+        features.append(feature_index(bool(white & chess.BB_SQUARES[square]), board.piece_type_at(square), square))
+    return features
+
+
+def taper(material, mg_psqt, eg_psqt, phase):
+    """
+    Static score from the summed terms, the same as the lazy score in evaluate() without its offset
+    Works on numbers and on NumPy arrays
+    """
+    if np is not None and isinstance(phase, np.ndarray):
+        mg_phase = np.minimum(phase, total_phase)
+    else:
+        mg_phase = min(phase, total_phase)
+    return material_weight * material + psqt_weight * (mg_psqt * mg_phase + eg_psqt * (total_phase - mg_phase)) / total_phase
+
+
+def score_positions(boards):
+    """
+    Static scores of the boards, each from the point of view of its side to move
+    """
+    if not boards:
+        return []
+    rows = [board_features(board) for board in boards]
+    weights = [1 if board.turn == chess.WHITE else -1 for board in boards]
+    if np is None:
+        return [weight * taper(sum(feature_material[f] for f in row), sum(feature_mg_psqt[f] for f in row), \
+                               sum(feature_eg_psqt[f] for f in row), sum(feature_phase[f] for f in row)) \
+                for row, weight in zip(rows, weights)]
+
+    width = max(len(row) for row in rows)
+    indices = np.array([row + [PADDING] * (width - len(row)) for row in rows])
+    material, mg_psqt, eg_psqt, phase = feature_values[:, indices].sum(axis = 2)
+    return (taper(material, mg_psqt, eg_psqt, phase) * np.array(weights)).tolist()
+
+
+def score_moves(board, moves):
+    """
+    Static scores of the positions after each move, from the point of view of the side making the moves
+    Each child is the board's incremental terms plus the features the move adds minus the ones it removes
+    """
+    if not moves:
+        return []
+    weight = 1 if board.turn == chess.WHITE else -1
+    features = [move_features(board, move) for move in moves]
+    if np is None:
+        scores = []
+        for removed, added in features:
+            scores.append(weight * taper(board.material + sum(feature_material[f] for f in added) - sum(feature_material[f] for f in removed), \
+                                         board.mg_psqt + sum(feature_mg_psqt[f] for f in added) - sum(feature_mg_psqt[f] for f in removed), \
+                                         board.eg_psqt + sum(feature_eg_psqt[f] for f in added) - sum(feature_eg_psqt[f] for f in removed), \
+                                         board.phase + sum(feature_phase[f] for f in added) - sum(feature_phase[f] for f in removed)))
+        return scores
+
+    indices = np.array(features) # [move][removed or added][2]
+    deltas = feature_values[:, indices].sum(axis = 3) # [term][move][removed or added]
+    terms = deltas[:, :, 1] - deltas[:, :, 0]
+    material = board.material + terms[0]
+    mg_psqt = board.mg_psqt + terms[1]
+    eg_psqt = board.eg_psqt + terms[2]
+    phase = board.phase + terms[3]
+    return (taper(material, mg_psqt, eg_psqt, phase) * weight).tolist()
+
+
+def static_score(board):
+    """
+    Static score of the board from the point of view of its side to move, from its incremental terms
+    """
+    weight = 1 if board.turn == chess.WHITE else -1
+    return weight * taper(board.material, board.mg_psqt, board.eg_psqt, board.phase)
@@ -0,0 +1,94 @@
+"""
+Not Magnus
+Classical chess engine by Devin Zhang
+
+Benchmark that searches a fixed set of positions to a fixed depth, for measuring speed and
+checking that a change did not change the search
+"""
+import time
+import search
+from search import *
+
+
+BENCH_DEPTH = 3 # Default search depth of each position
+
+# Openings, middlegames, and endgames, including positions with checks, promotions, and tablebase-sized material
+bench_fens = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 10",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 11",
+    "4rrk1/pp1n3p/3q2pQ/2p1pb2/2PP4/2P3N1/P2B2PP/4RRK1 b - - 7 19",
+    "rq3rk1/ppp2ppp/1bnpb3/3N2B1/3NP3/7P/PPPQ1PP1/2KR3R w - - 7 14",
+    "r1bq1r1k/1pp1n1pp/1p1p4/4p2Q/4Pp2/1BNP4/PPP2PPP/3R1RK1 w - - 2 14",
+    "r3r1k1/2p2ppp/p1p1bn2/8/1q2P3/2NPQN2/PPP3PP/R4RK1 b - - 2 15",
+    "r1bbk1nr/pp3p1p/2n5/1N4p1/2Np1B2/8/PPP2PPP/2KR1B1R w kq - 0 13",
+    "r1bq1rk1/ppp1nppp/4n3/3p3Q/3P4/1BP1B3/PP1N2PP/R4RK1 w - - 1 16",
+    "4r1k1/r1q2ppp/ppp2n2/4P3/5Rb1/1N1BQ3/PPP3PP/R5K1 w - - 1 17",
+    "2rqkb1r/ppp2p2/2npb1p1/1N1Nn2p/2P1PP2/8/PP2B1PP/R1BQK2R b KQ - 0 11",
+    "r1bq1r1k/b1p1npp1/p2p3p/1p6/3PP3/1B2NN2/PP3PPP/R2Q1RK1 w - - 1 16",
+    "3r1rk1/p5pp/bpp1pp2/8/q1PP1P2/b3P3/P2NQRPP/1R2B1K1 b - - 6 22",
+    "r1q2rk1/2p1bppp/2Pp4/p6b/Q1PNp3/4B3/PP1R1PPP/2K4R w - - 2 18",
+    "4k2r/1pb2ppp/1p2p3/1R1p4/3P4/2r1PN2/P4PPP/1R4K1 b - - 3 22",
+    "3q2k1/pb3p1p/4pbp1/2r5/PpN2N2/1P2P2P/5PP1/Q2R2K1 b - - 4 26",
+    "6k1/6p1/6Pp/ppp5/3pn2P/1P3K2/1PP2P2/8 b - - 3 54",
+    "r2q1rk1/1ppb1ppp/p1np1n2/4p3/2B1P3/2NP1N2/PPPQ1PPP/R3R1K1 b - - 1 10",
+    "5rk1/q6p/2p3bR/1pPp1rP1/1P1Pp3/P3B1Q1/1K3P2/R7 w - - 93 90",
+    "4rrk1/1p1nq3/p7/2p1P1pp/3P2bp/3Q1Bn1/PPPB4/1K2R1NR w - - 40 21",
+    "r3k2r/3nnpbp/q2pp1p1/p7/Pp1PPPP1/4BNN1/1P5P/R2Q1RK1 w kq - 0 16",
+    "3Qb1k1/1r2ppb1/pN1n2q1/Pp1Pp1Pr/4P2p/4BP2/4B1R1/1R5K b - - 11 40",
+    "4k3/3q1r2/1N2r1b1/3ppN2/2nPP3/1B1R2n1/2R1Q3/3K4 w - - 5 1",
+    "8/8/8/8/5kp1/P7/8/1K1N4 w - - 0 1",
+    "8/8/8/5N2/8/p7/8/2NK3k w - - 0 1",
+    "8/3k4/8/8/8/4B3/4KN2/2B5 w - - 0 1",
+    "8/8/1P6/5pr1/8/4R3/7k/2K5 w - - 0 1",
+    "8/2p4P/8/kr6/6R1/8/8/1K6 w - - 0 1",
+    "8/8/3P3k/8/1p6/8/1P6/1K3n2 b - - 0 1",
+    "8/R7/2q5/8/6k1/8/1P5p/K6R w - - 0 124",
+    "6k1/3b3r/1p1p4/p1n2p2/1PPNpP1q/P3Q1p1/1R1RB1P1/5K2 b - - 0 1",
+    "r2r1n2/pp2bk2/2p1p2p/3q4/3PN1QP/2P3R1/P4PP1/5RK1 w - - 0 1",
+    "8/8/8/8/8/6k1/6p1/6K1 b - - 0 1",
+    "7k/8/6KP/8/8/3B4/8/8 w - - 0 1",
+    "3r2k1/1p3ppp/2pq4/p1n5/P6P/1P6/1PB2QP1/1K2R3 w - - 0 1",
+    "r1b1k2r/ppppnppp/2n2q2/2b5/3NP3/2P1B3/PP3PPP/RN1QKB1R w KQkq - 0 1",
+    "2r3k1/1p2q1pp/2b1pr2/p1pp4/6Q1/1P1PP1R1/P1PN2PP/5RK1 w - - 0 1",
+    "1r2k2r/pp2pp1p/2pp1np1/q7/2PPP3/2N5/PP1Q1PPP/R3KB1R b KQk - 1 13",
+    "8/4kp2/8/2KP4/8/8/8/8 w - - 0 1",
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1",
+]
+
+
+def bench(depth = BENCH_DEPTH, stop_event = None):
+    """
+    Searches every bench position to the depth with cleared tables and sends the total nodes, time,
+    nodes per second, and signature (the total nodes, which only changes when the search does)
+    Opening book, tablebase, and Lazy SMP helpers are not used, so the node count is reproducible
+    Returns the total nodes
+    """
+    tablebase_enabled = tablebase.enabled
+    tablebase.enabled = False # Probe results would depend on which tables are installed
+    total_nodes = 0
+    start_time = time.time_ns()
+    for i, fen in enumerate(bench_fens):
+        board = Board(fen)
+        ttable.clear()
+        clear_move_ordering()
+        search.evaluator.clear()
+        board.search_root = len(board.zobrist_stack)
+        search.evaluator.prepare(board)
+
+        search.nodes = 0
+        control = SearchControl(stop_event = stop_event)
+        move, score, completed_depth, pv = iterative_deepening(board, depth, control, output = False)
+        total_nodes += search.nodes
+        send_output("Position {}/{}: {} bestmove {} nodes {}\n".format(i + 1, len(bench_fens), fen, move, search.nodes))
+        if control.stopped:
+            break
+
+    elapsed = max(time.time_ns() - start_time, 1)
+    tablebase.enabled = tablebase_enabled
+    send_output("\n===========================\n")
+    send_output("Total time (ms) : {}\n".format(elapsed // 10**6))
+    send_output("Nodes searched  : {}\n".format(total_nodes))
+    send_output("Nodes/second    : {}\n".format(int(total_nodes / (elapsed * 10**-9))))
+    send_output("Signature       : {}\n".format(total_nodes))
+    return total_nodes
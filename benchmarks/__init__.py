@@ -0,0 +1,127 @@
+"""
+Not Magnus
+Classical chess engine by Devin Zhang
+
+Microbenchmarks of the engine's components, run from the repository folder with
+> python -m benchmarks
+
+Each benchmark (see components.py) times a component over a fixed set of positions and reports the
+nanoseconds per call. The results are compared to the committed baseline.json, and the run exits with
+a non-zero status if any benchmark is slower than its baseline by more than the tolerance, which is
+wider for benchmarks of very short calls.
+Baselines are only meaningful on the machine they were recorded on, record a new one with --update-baseline
+"""
+import gc
+import json
+import os
+import platform
+import statistics
+import time
+from .components import *
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_TOLERANCE = 0.25 # Fraction a benchmark may be slower than its baseline before it counts as a regression
+SHORT_CALL_TOLERANCE = 0.5 # Tolerance of benchmarks with calls shorter than SHORT_CALL_TIME, whose timings are noisier
+SHORT_CALL_TIME = 10000 # Nanoseconds per call below which a benchmark gets SHORT_CALL_TOLERANCE
+DEFAULT_REPEAT = 9 # Timed runs of each benchmark, the median is kept
+MIN_RUN_TIME = 0.25 # Seconds each timed run lasts at least, however short the calls are
+
+
+def time_pass(setup, benchmark):
+    """
+    Returns the nanoseconds one pass of the benchmark took and its calls, after the setup which is not timed
+    """
+    if setup:
+        setup()
+    start_time = time.perf_counter_ns()
+    calls = benchmark()
+    return time.perf_counter_ns() - start_time, calls
+
+
+def calibrate(setup, benchmark):
+    """
+    Returns the passes a timed run needs to last MIN_RUN_TIME
+    The first pass also warms up the caches
+    """
+    time_pass(setup, benchmark)
+    passes = 1
+    while True:
+        elapsed = sum(time_pass(setup, benchmark)[0] for i in range(passes))
+        if elapsed >= MIN_RUN_TIME * 10**9:
+            return passes
+        passes *= 2
+
+
+def time_run(setup, benchmark, passes):
+    """
+    Returns the nanoseconds per call of one timed run and the calls in a pass, with the garbage collector off like timeit
+    """
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    elapsed = 0
+    calls = 0
+    for i in range(passes):
+        pass_time, pass_calls = time_pass(setup, benchmark)
+        elapsed += pass_time
+        calls += pass_calls
+    if gc_enabled:
+        gc.enable()
+    return elapsed / calls, calls // passes
+
+
+def run_benchmarks(names = None, repeat = DEFAULT_REPEAT, output = print):
+    """
+    Runs the benchmarks with the given names, or all of them, and returns the results as a dictionary
+    that can be saved as JSON
+    The timed runs take turns between the benchmarks, so a slow spell of the machine does not hit every run
+    of one benchmark, and the median run of each is kept
+    """
+    selected = {name: benchmark for name, benchmark in benchmarks.items() if not names or name in names}
+    passes = {name: calibrate(*benchmark) for name, benchmark in selected.items()}
+    times = {name: [] for name in selected}
+    calls = {}
+    for i in range(repeat):
+        for name, benchmark in selected.items():
+            ns_per_call, calls[name] = time_run(*benchmark, passes[name])
+            times[name].append(ns_per_call)
+
+    results = {"python": platform.python_version(), "machine": platform.machine(), "benchmarks": {}}
+    for name in selected:
+        ns_per_call = statistics.median(times[name])
+        results["benchmarks"][name] = {"ns_per_call": round(ns_per_call, 1), "calls_per_pass": calls[name]}
+        output("{:<24} {:>12.1f} ns/call".format(name, ns_per_call))
+    return results
+
+
+def compare(results, baseline, tolerance = DEFAULT_TOLERANCE, short_call_tolerance = SHORT_CALL_TOLERANCE, output = print):
+    """
+    Compares the results to the baseline, returns the names of the benchmarks that regressed
+    Benchmarks with calls shorter than SHORT_CALL_TIME in the baseline are allowed short_call_tolerance
+    Benchmarks without a baseline are reported but not counted as regressions
+    """
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if not base:
+            output("{:<24} no baseline".format(name))
+            continue
+        ratio = result["ns_per_call"] / base["ns_per_call"]
+        allowed = tolerance if base["ns_per_call"] >= SHORT_CALL_TIME else max(tolerance, short_call_tolerance)
+        regressed = ratio > 1 + allowed
+        if regressed:
+            regressions.append(name)
+        output("{:<24} {:>12.1f} ns/call, baseline {:>12.1f}, {:+.1%} (allowed {:+.0%}){}".format( \
+            name, result["ns_per_call"], base["ns_per_call"], ratio - 1, allowed, " REGRESSION" if regressed else ""))
+    return regressions
+
+
+def load_results(file_name):
+    with open(file_name) as file:
+        return json.load(file)
+
+
+def save_results(results, file_name):
+    with open(file_name, "w") as file:
+        json.dump(results, file, indent = 4, sort_keys = True)
+        file.write("\n")
@@ -0,0 +1,61 @@
+"""
+Not Magnus
+Classical chess engine by Devin Zhang
+
+Runs the component microbenchmarks and compares them to the baseline
+> python -m benchmarks [--output results.json] [--baseline file] [--tolerance 0.25] [--short-call-tolerance 0.5]
+                       [--repeat 9] [--update-baseline] [names...]
+Exits with status 1 if a benchmark regressed
+"""
+import argparse
+import sys
+from benchmarks import *
+
+
+def main():
+    parser = argparse.ArgumentParser(prog = "python -m benchmarks", description = "Not Magnus component microbenchmarks")
+    parser.add_argument("names", nargs = "*", help = "benchmarks to run, all by default: " + ", ".join(benchmarks))
+    parser.add_argument("--output", help = "file to save the results to as JSON")
+    parser.add_argument("--baseline", default = BASELINE_FILE, help = "baseline results to compare to")
+    parser.add_argument("--tolerance", type = float, default = DEFAULT_TOLERANCE, help = "fraction slower than the baseline that counts as a regression")
+    parser.add_argument("--short-call-tolerance", type = float, default = SHORT_CALL_TOLERANCE, \
+                        help = "tolerance of benchmarks with calls shorter than {} ns".format(SHORT_CALL_TIME))
+    parser.add_argument("--repeat", type = int, default = DEFAULT_REPEAT, help = "timed runs of each benchmark, the median is kept")
+    parser.add_argument("--update-baseline", action = "store_true", help = "save the results as the new baseline instead of comparing")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.names if name not in benchmarks]
+    if unknown:
+        parser.error("unknown benchmarks: " + ", ".join(unknown))
+
+    results = run_benchmarks(args.names, args.repeat)
+    if args.output:
+        save_results(results, args.output)
+    if args.update_baseline:
+        if args.names: # Keep the baselines of the benchmarks that were not run
+            try:
+                baseline = load_results(args.baseline)
+                baseline["benchmarks"].update(results["benchmarks"])
+                results["benchmarks"] = baseline["benchmarks"]
+            except FileNotFoundError:
+                pass
+        save_results(results, args.baseline)
+        print("Saved baseline to {}".format(args.baseline))
+        return 0
+
+    try:
+        baseline = load_results(args.baseline)
+    except FileNotFoundError:
+        print("No baseline at {}, record one with --update-baseline".format(args.baseline))
+        return 1
+    print()
+    regressions = compare(results, baseline, args.tolerance, args.short_call_tolerance)
+    if regressions:
+        print("\n{} regressed by more than allowed: {}".format(len(regressions), ", ".join(regressions)))
+        return 1
+    print("\nNo regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
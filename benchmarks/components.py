@@ -0,0 +1,135 @@
+"""
+Not Magnus
+Classical chess engine by Devin Zhang
+
+The component benchmarks, each a function that makes one pass over its fixed positions and returns
+the number of calls it made, with an optional setup function called before every pass outside the timing.
+Positions come from the bench suite (bench.py), split by game phase
+"""
+from bench import bench_fens
+import search
+from search import *
+
+
+def make_positions(fens):
+    """
+    Boards of the FENs, each with its MoveContext with the legal moves generated, as the search has them
+    """
+    positions = []
+    for fen in fens:
+        board = Board(fen)
+        ctx = MoveContext(board)
+        ctx.moves
+        positions.append((board, ctx))
+    return positions
+
+
+all_positions = make_positions(bench_fens)
+opening_positions = [(board, ctx) for board, ctx in all_positions if board.phase >= 22]
+middlegame_positions = [(board, ctx) for board, ctx in all_positions if 10 <= board.phase < 22]
+endgame_positions = [(board, ctx) for board, ctx in all_positions if board.phase < 10]
+tactical_positions = [(board, ctx) for board, ctx in all_positions if sum(ctx.is_capture(move) for move in ctx.moves) >= 3]
+
+
+def make_pushed_moves(positions):
+    """
+    (board after the move, move, MoveContext of the position the move was made from) of every legal move
+    """
+    pushed_moves = []
+    for board, ctx in positions:
+        for move in ctx.moves:
+            child = board.copy()
+            child.push(move)
+            pushed_moves.append((child, move, ctx))
+    return pushed_moves
+
+
+pushed_moves = make_pushed_moves(all_positions)
+
+
+def clear_evaluation_tables():
+    """
+    Setup of the evaluation benchmarks, empties the pawn and evaluation hash tables so every call computes its score
+    """
+    pawn_hash_table.clear()
+    eval_hash_table.clear()
+
+
+def evaluate_positions(positions):
+    """
+    Full evaluations of the positions
+    """
+    for board, ctx in positions:
+        evaluate(board, ctx)
+    return len(positions)
+
+
+def bench_evaluate_opening():
+    return evaluate_positions(opening_positions)
+
+
+def bench_evaluate_middlegame():
+    return evaluate_positions(middlegame_positions)
+
+
+def bench_evaluate_endgame():
+    return evaluate_positions(endgame_positions)
+
+
+def bench_rate():
+    """
+    Move ordering scores of every legal move, without a transposition table move
+    """
+    calls = 0
+    for board, ctx in all_positions:
+        for move in ctx.moves:
+            rate(board, move, None, ctx)
+        calls += len(ctx.moves)
+    return calls
+
+
+def bench_qsearch():
+    """
+    Quiescence searches with a full window from positions with several captures, run after clear_evaluation_tables()
+    """
+    for board, ctx in tactical_positions:
+        search.nodes = 0
+        qsearch(board, -MATE_SCORE, MATE_SCORE, SearchControl())
+    return len(tactical_positions)
+
+
+def bench_get_bb_king_zone():
+    for color in chess.COLORS:
+        for square in chess.SQUARES:
+            get_bb_king_zone(square, color)
+    return 2 * 64
+
+
+def bench_reduction_ok():
+    """
+    Late move reduction checks of every legal move, as if it were the sixth move searched at depth 3
+    Like in negamax the move is pushed for the check, the boards are made ahead in pushed_moves so
+    the timing is not mostly push() and pop()
+    """
+    for child, move, ctx in pushed_moves:
+        reduction_ok(child, 3, move, 5, False, ctx)
+    return len(pushed_moves)
+
+
+def bench_null_move_ok():
+    for board, ctx in all_positions:
+        null_move_ok(board, ctx)
+    return len(all_positions)
+
+
+# Benchmarks by name, in the order they run, as (setup or None, pass)
+benchmarks = {
+    "evaluate_opening": (clear_evaluation_tables, bench_evaluate_opening),
+    "evaluate_middlegame": (clear_evaluation_tables, bench_evaluate_middlegame),
+    "evaluate_endgame": (clear_evaluation_tables, bench_evaluate_endgame),
+    "rate": (None, bench_rate),
+    "qsearch": (clear_evaluation_tables, bench_qsearch),
+    "get_bb_king_zone": (None, bench_get_bb_king_zone),
+    "reduction_ok": (None, bench_reduction_ok),
+    "null_move_ok": (None, bench_null_move_ok),
+}
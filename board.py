@@ -0,0 +1,221 @@
+"""
+Not Magnus
+Classical chess engine by Devin Zhang
+
+Board used by the engine, a python-chess board that keeps extra state up to date on make/unmake
+"""
+import chess
+import chess.polyglot
+from evaluation_values import *
+
+
+# Zobrist keys, same random numbers as the polyglot opening book format
+ZOBRIST_ARRAY = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+ZOBRIST_PIECES = [[[ZOBRIST_ARRAY[64 * ((piece - 1) * 2 + color) + square] for square in range(64)] \
+                   for piece in range(7)] for color in [chess.BLACK, chess.WHITE]] # [color][piece][square], piece 0 unused
+ZOBRIST_CASTLING = [(chess.BB_H1, ZOBRIST_ARRAY[768]), (chess.BB_A1, ZOBRIST_ARRAY[769]), \
+                    (chess.BB_H8, ZOBRIST_ARRAY[770]), (chess.BB_A8, ZOBRIST_ARRAY[771])]
+ZOBRIST_EP = [ZOBRIST_ARRAY[772 + chess.square_file(square)] for square in range(64)]
+ZOBRIST_TURN = ZOBRIST_ARRAY[780]
+
+# Incremental evaluation terms, signed from white's point of view
+MATERIAL = [[0] + [-value for value in material_values[:5]] + [0], [0] + list(material_values[:5]) + [0]] # [color][piece], kings left out
+MG_PSQT = [[[0] * 64] + [[-value for value in mg_psqts[chess.piece_symbol(piece)]] for piece in chess.PIECE_TYPES], \
+           [[0] * 64] + [list(mg_psqts[chess.piece_symbol(piece).upper()]) for piece in chess.PIECE_TYPES]] # [color][piece][square]
+EG_PSQT = [[[0] * 64] + [[-value for value in eg_psqts[chess.piece_symbol(piece)]] for piece in chess.PIECE_TYPES], \
+           [[0] * 64] + [list(eg_psqts[chess.piece_symbol(piece).upper()]) for piece in chess.PIECE_TYPES]] # [color][piece][square]
+
+NO_SEARCH = 1 << 30 # Search root index used when no search is running
+
+
+def castling_key(castling_rights):
+    """
+    Zobrist key of the castling rights bitboard (rook squares with castling rights)
+    """
+    key = 0
+    for rook_bb, rights_key in ZOBRIST_CASTLING:
+        if castling_rights & rook_bb:
+            key ^= rights_key
+    return key
+
+
+class Board(chess.Board):
+    """
+    Chess board that incrementally maintains state used by the search and evaluation:
+    - A 64-bit polyglot-compatible Zobrist key, and a Zobrist key of just the pawns for the pawn hash table
+    - Material, middlegame and endgame PSQT sums (from white's point of view) and game phase
+    - The accumulator of the evaluator, if it attached one (see evaluators.py)
+
+    The key of every previous position is kept in zobrist_stack, parallel to move_stack, so
+    repetition checks read the stack instead of a global table
+    """
+
+    def clear_stack(self):
+        """
+        Called by python-chess whenever a new position is set up, recomputes everything from scratch
+        """
+        super().clear_stack()
+        self.castling_rights = self.clean_castling_rights()
+        self.zobrist = chess.polyglot.zobrist_hash(self)
+        self.zobrist_stack = []
+        self.search_root = NO_SEARCH
+        self.pawn_zobrist = 0
+        for square in chess.scan_forward(self.pawns):
+            self.pawn_zobrist ^= ZOBRIST_PIECES[bool(self.occupied_co[chess.WHITE] & chess.BB_SQUARES[square])][chess.PAWN][square]
+
+        self.material = 0
+        self.mg_psqt = 0
+        self.eg_psqt = 0
+        self.phase = 0
+        for square in chess.scan_forward(self.occupied):
+            piece = self.piece_type_at(square)
+            color = bool(self.occupied_co[chess.WHITE] & chess.BB_SQUARES[square])
+            self.material += MATERIAL[color][piece]
+            self.mg_psqt += MG_PSQT[color][piece][square]
+            self.eg_psqt += EG_PSQT[color][piece][square]
+            self.phase += phase_scores[piece]
+        self.eval_stack = []
+        self.accumulator = None # Computed for the old position, the evaluator attaches a new one
+
+    def copy(self, *, stack = True):
+        board = super().copy(stack = stack)
+        board.zobrist = self.zobrist
+        board.zobrist_stack = self.zobrist_stack[len(self.zobrist_stack) - len(board.move_stack):]
+        board.search_root = self.search_root
+        board.pawn_zobrist = self.pawn_zobrist
+        board.material = self.material
+        board.mg_psqt = self.mg_psqt
+        board.eg_psqt = self.eg_psqt
+        board.phase = self.phase
+        board.eval_stack = self.eval_stack[len(self.eval_stack) - len(board.move_stack):]
+        board.accumulator = None # The evaluator attaches a new one, the stack of this one belongs to the original board
+        return board
+
+    def _ep_key(self):
+        """
+        Zobrist key of the en passant file, only if a pawn of the side to move could capture
+        """
+        ep_square = self.ep_square
+        if ep_square is not None and chess.BB_PAWN_ATTACKS[not self.turn][ep_square] & self.pawns & self.occupied_co[self.turn]:
+            return ZOBRIST_EP[ep_square]
+        return 0
+
+    def push(self, move):
+        """
+        Makes the move and updates the Zobrist key and evaluation terms
+        from the pieces on the squares the move changes
+        """
+        key = self.zobrist
+        material = self.material
+        mg_psqt = self.mg_psqt
+        eg_psqt = self.eg_psqt
+        phase = self.phase
+        pawn_key = self.pawn_zobrist
+        self.zobrist_stack.append(key)
+        self.eval_stack.append((material, mg_psqt, eg_psqt, phase, pawn_key))
+        castling_rights = self.castling_rights
+        key ^= self._ep_key() ^ ZOBRIST_TURN
+
+        accumulator = self.accumulator
+        if not move:
+            if accumulator is not None:
+                accumulator.push((), ())
+            super().push(move)
+            self.zobrist = key ^ self._ep_key()
+            return
+
+        # Squares whose contents change
+        from_square = move.from_square
+        to_square = move.to_square
+        if self.kings & chess.BB_SQUARES[from_square] and \
+            (abs(to_square - from_square) == 2 or self.occupied_co[self.turn] & chess.BB_SQUARES[to_square]):
+            back_rank = from_square & ~7
+            squares = range(back_rank, back_rank + 8) # Castling, king and rook move along the back rank
+        elif to_square == self.ep_square and self.pawns & chess.BB_SQUARES[from_square] and (to_square - from_square) % 8:
+            squares = (from_square, to_square, to_square - 8 if self.turn == chess.WHITE else to_square + 8)
+        else:
+            squares = (from_square, to_square)
+
+        if accumulator is not None:
+            removed = accumulator.features(self, squares)
+
+        # Remove the pieces on the changed squares
+        white = self.occupied_co[chess.WHITE]
+        for square in squares:
+            piece = self.piece_type_at(square)
+            if piece:
+                color = bool(white & chess.BB_SQUARES[square])
+                key ^= ZOBRIST_PIECES[color][piece][square]
+                if piece == chess.PAWN:
+                    pawn_key ^= ZOBRIST_PIECES[color][piece][square]
+                material -= MATERIAL[color][piece]
+                mg_psqt -= MG_PSQT[color][piece][square]
+                eg_psqt -= EG_PSQT[color][piece][square]
+                phase -= phase_scores[piece]
+
+        super().push(move)
+
+        # Add back whatever is on those squares after the move
+        white = self.occupied_co[chess.WHITE]
+        for square in squares:
+            piece = self.piece_type_at(square)
+            if piece:
+                color = bool(white & chess.BB_SQUARES[square])
+                key ^= ZOBRIST_PIECES[color][piece][square]
+                if piece == chess.PAWN:
+                    pawn_key ^= ZOBRIST_PIECES[color][piece][square]
+                material += MATERIAL[color][piece]
+                mg_psqt += MG_PSQT[color][piece][square]
+                eg_psqt += EG_PSQT[color][piece][square]
+                phase += phase_scores[piece]
+
+        if self.castling_rights != castling_rights:
+            key ^= castling_key(castling_rights) ^ castling_key(self.castling_rights)
+        self.zobrist = key ^ self._ep_key()
+        self.material = material
+        self.mg_psqt = mg_psqt
+        self.eg_psqt = eg_psqt
+        self.phase = phase
+        self.pawn_zobrist = pawn_key
+        if accumulator is not None:
+            accumulator.push(removed, accumulator.features(self, squares))
+
+    def pop(self):
+        move = super().pop()
+        accumulator = self.accumulator
+        if accumulator is not None:
+            if accumulator.stack:
+                accumulator.pop()
+            else: # Attached after this move was made, the evaluator attaches a new one when it is needed
+                self.accumulator = None
+        self.zobrist = self.zobrist_stack.pop()
+        self.material, self.mg_psqt, self.eg_psqt, self.phase, self.pawn_zobrist = self.eval_stack.pop()
+        return move
+
+    def gives_check(self, move):
+        """
+        Probes if the move gives check, without the bookkeeping of a full push/pop
+        """
+        chess.Board.push(self, move)
+        try:
+            return self.is_check()
+        finally:
+            chess.Board.pop(self)
+
+    def is_repetition_draw(self):
+        """
+        Returns true if the position is a draw by repetition
+        Only scans back to the last irreversible move (pawn move or capture). A position seen once
+        before inside the current search counts as a draw, otherwise it must have been seen twice before
+        """
+        key = self.zobrist
+        stack = self.zobrist_stack
+        count = 0
+        for i in range(len(stack) - 4, max(len(stack) - self.halfmove_clock, 0) - 1, -2):
+            if stack[i] == key:
+                if i >= self.search_root:
+                    return True
+                count += 1
+                if count >= 2:
+                    return True
+        return False
@@ -0,0 +1,145 @@
+"""
+Not Magnus
+Classical chess engine by Devin Zhang
+
+Polyglot opening book read in place from a memory-mapped file
+"""
+from bisect import bisect_right
+import mmap
+import random
+import struct
+import chess
+
+
+ENTRY_SIZE = 16 # Key (8 bytes), move (2), weight (2), learn (4), big-endian
+INDEX_STRIDE = 256 # Entries between the keys kept in the preloaded index
+ENTRY_STRUCT = struct.Struct(">QHH")
+KEY_STRUCT = struct.Struct(">Q")
+
+
+class OpeningBook:
+    """
+    Polyglot opening book (https://sourceforge.net/projects/codekiddy-chess/files/)
+
+    The book file is memory-mapped on the first lookup and stays mapped until close(). Its entries are sorted
+    by the position's polyglot Zobrist key, which is the board's zobrist key, so a lookup is a binary search
+    reading keys straight from the map. The key of every INDEX_STRIDE-th entry is read into a list when the
+    file is mapped, so most of the search runs on that list and only one block of the file is touched.
+    If the file cannot be mapped the book is disabled and the reason is kept in error.
+
+    selection is "weighted" to pick a move at random in proportion to the entry weights, or "best" for the
+    move with the highest weight. The book is only used for the first max_depth moves of the game
+    """
+
+    def __init__(self, location, enabled = False, selection = "weighted", max_depth = 20):
+        self.location = location
+        self.enabled = enabled
+        self.selection = selection
+        self.max_depth = max_depth
+        self.file = None
+        self.map = None
+        self.entries = 0
+        self.index = []
+        self.error = None
+
+    def open(self):
+        """
+        Maps the book file and reads the index, or disables the book if the file cannot be mapped
+        Returns true if the book is open
+        """
+        if self.map is not None:
+            return True
+        try:
+            self.file = open(self.location, "rb")
+            self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        except (OSError, ValueError) as error: # Empty files cannot be mapped
+            self.close()
+            self.enabled = False
+            self.error = error
+            return False
+        self.entries = len(self.map) // ENTRY_SIZE
+        self.index = [KEY_STRUCT.unpack_from(self.map, i * ENTRY_SIZE)[0] for i in range(0, self.entries, INDEX_STRIDE)]
+        self.error = None
+        return True
+
+    def close(self):
+        """
+        Unmaps the book file, it is mapped again by the next lookup
+        """
+        if self.map is not None:
+            self.map.close()
+        if self.file is not None:
+            self.file.close()
+        self.file = None
+        self.map = None
+        self.entries = 0
+        self.index = []
+
+    def set_location(self, location):
+        """
+        Uses another book file
+        """
+        self.close()
+        self.location = location
+
+    def find(self, key):
+        """
+        Returns the number of the first entry with the key, or the number of entries if there is none
+        """
+        block = max(0, bisect_right(self.index, key - 1) - 1) # Last indexed entry with a smaller key
+        low = block * INDEX_STRIDE
+        high = min(low + INDEX_STRIDE, self.entries) # The next indexed entry has a key at least as large
+        book_map = self.map
+        while low < high:
+            middle = (low + high) // 2
+            if KEY_STRUCT.unpack_from(book_map, middle * ENTRY_SIZE)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def moves(self, board):
+        """
+        Returns the legal book moves of the position as a list of (move, weight)
+        """
+        if not self.open():
+            return []
+        key = board.zobrist
+        moves = []
+        i = self.find(key)
+        while i < self.entries:
+            entry_key, code, weight = ENTRY_STRUCT.unpack_from(self.map, i * ENTRY_SIZE)
+            if entry_key != key:
+                break
+            move = self.decode_move(board, code)
+            if board.is_legal(move):
+                moves.append((move, weight))
+            i += 1
+        return moves
+
+    def decode_move(self, board, code):
+        """
+        Unpacks a polyglot move, where castling is stored as the king moving to its rook's square
+        """
+        from_square = (code >> 6) & 0x3F
+        to_square = code & 0x3F
+        promotion = (code >> 12) & 0x7
+        if board.kings & chess.BB_SQUARES[from_square] and board.rooks & board.occupied_co[board.turn] & chess.BB_SQUARES[to_square]:
+            to_square = (to_square & ~7) + (6 if to_square > from_square else 2) # To the g or c file
+        return chess.Move(from_square, to_square, promotion + 1 if promotion else None)
+
+    def choose(self, board):
+        """
+        Returns a book move for the position following the selection rule, or None if out of book
+        """
+        if not self.enabled or board.ply() >= 2 * self.max_depth:
+            return None
+        moves = self.moves(board)
+        if not moves:
+            return None
+        if self.selection == "best":
+            return max(moves, key = lambda entry : entry[1])[0]
+        weights = [weight for move, weight in moves]
+        if not any(weights): # Only entries with no weight, pick any of them
+            weights = None
+        return random.choices([move for move, weight in moves], weights)[0]
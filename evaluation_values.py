@@ -8,6 +8,20 @@ from util import *
 # Material values
 material_values = (100, 320, 330, 500, 900, MATE_SCORE)
 
+# Weights of each evaluation term in the final score
+material_weight = 10
+psqt_weight = 1
+mobility_weight = 1
+piece_specific_weight = 1
+
+# Lazy evaluation, the other terms are skipped when material and PSQT alone are this far outside the search window
+lazy_eval_margin = material_values[0] * material_weight
+
+# Game phase weights indexed by piece type (none, pawn, knight, bishop, rook, queen, king), used for tapered evaluation
+phase_scores = (0, 0, 1, 1, 2, 4, 0)
+total_phase = 16*phase_scores[chess.PAWN] + 4*phase_scores[chess.KNIGHT] + 4*phase_scores[chess.BISHOP] \
+            + 4*phase_scores[chess.ROOK] + 2*phase_scores[chess.QUEEN]
+
 # Piece squares tables
 # Values are sorted so that index 0 corresponds with square A1, 1 = B1, ..., 62 = G8, 63 = H8
 w_mg_pawn_table = (0, 0, 0, 0, 0, 0, 0, 0, -35, -1, -20, -23, -15, 24, 38, -22, -26, -4, -4, -10, 3, 3, 33, -12, -27, -2, -5, 12, 17, 6, 10, -25, -14, 13, 6, 21, 23, 12, 17, -23, -6, 7, 26, 31, 65, 56, 25, -20, 98, 134, 61, 95, 68, 126, 34, -11, 0, 0, 0, 0, 0, 0, 0, 0)
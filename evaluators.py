@@ -0,0 +1,180 @@
+"""
+Not Magnus
+Classical chess engine by Devin Zhang
+
+Evaluators the search calls through, selected with the Evaluator UCI option
+"""
+try:
+    import numpy as np
+except ImportError: # NumPy is only needed by the accumulator evaluator
+    np = None
+from evaluate import *
+
+
+class Evaluator:
+    """
+    Interface of a position evaluator
+
+    - prepare(board) is called on the root board before a search, so the evaluator can attach
+      any incrementally updated state to it
+    - evaluate(board, ctx, alpha, beta) scores the position from the side to move's point of view,
+      ctx and the search window are optional and follow evaluate() in evaluate.py
+    - clear() empties any caches, called on a new game
+    Evaluators are created with an optional weights file, which evaluators without weights ignore
+    """
+    name = None
+
+    def __init__(self, weights_file = None):
+        pass
+
+    def prepare(self, board):
+        board.accumulator = None
+
+    def evaluate(self, board, ctx = None, alpha = -INF, beta = INF):
+        raise NotImplementedError
+
+    def clear(self):
+        pass
+
+
+class ClassicalEvaluator(Evaluator):
+    """
+    The hand-written evaluation in evaluate.py
+    """
+    name = "classical"
+
+    def evaluate(self, board, ctx = None, alpha = -INF, beta = INF):
+        return evaluate(board, ctx, alpha, beta)
+
+    def clear(self):
+        pawn_hash_table.clear()
+        eval_hash_table.clear()
+
+
+def feature_index(color, piece, square):
+    """
+    Input index of a piece on a square, 64 squares for each of the 12 colored pieces
+    """
+    return 64 * (6 * color + piece - 1) + square
+
+
+class Accumulator:
+    """
+    Sum of the input weights of every piece on the board plus the input bias, updated on make/unmake
+    The board calls push() with the features removed and added by a move, and pop() when it is undone
+    """
+
+    def __init__(self, weights, board):
+        self.input_weights = weights["input_weights"]
+        self.stack = []
+        self.values = weights["input_bias"] + self.input_weights[self.features(board, range(64))].sum(axis = 0)
+
+    def features(self, board, squares):
+        """
+        Input indices of the pieces on the squares
+        """
+        white = board.occupied_co[chess.WHITE]
+        features = []
+        for square in squares:
+            piece = board.piece_type_at(square)
+            if piece:
+                features.append(feature_index(bool(white & chess.BB_SQUARES[square]), piece, square))
+        return features
+
+    def push(self, removed, added):
+        self.stack.append(self.values)
+        if removed or added:
+            input_weights = self.input_weights
+            values = self.values.copy()
+            for feature in added:
+                values += input_weights[feature]
+            for feature in removed:
+                values -= input_weights[feature]
+            self.values = values
+
+    def pop(self):
+        self.values = self.stack.pop()
+
+
+class AccumulatorEvaluator(Evaluator):
+    """
+    Evaluates a position from 768 inputs, one for each colored piece on each square
+
+    The first layer is the accumulator, which is kept up to date by the board on make/unmake.
+    A small dense head scores it: relu(accumulator) -> hidden layer -> relu -> score from white's point of view
+
+    Weights are loaded from a NumPy .npz file with the arrays input_weights (768 x N), input_bias (N),
+    hidden_weights (N x M), hidden_bias (M), output_weights (M), and output_bias (scalar).
+    Without a file the weights reproduce the material and PSQT terms of the classical evaluation,
+    with the middlegame and endgame tables averaged
+    """
+    name = "accumulator"
+
+    def __init__(self, weights_file = None):
+        if np is None:
+            raise ImportError("The accumulator evaluator requires NumPy")
+        if weights_file:
+            self.load(weights_file)
+        else:
+            self.weights = self.default_weights()
+
+    def default_weights(self):
+        """
+        Linear weights that the head passes through unchanged, as relu(x) - relu(-x) = x
+        """
+        values = np.zeros(768, dtype = np.float32)
+        for color in chess.COLORS:
+            color_weight = 1 if color == chess.WHITE else -1
+            for piece in chess.PIECE_TYPES:
+                symbol = chess.piece_symbol(piece).upper() if color == chess.WHITE else chess.piece_symbol(piece)
+                for square in chess.SQUARES:
+                    material = material_values[piece - 1] if piece != chess.KING else 0
+                    psqt = (mg_psqts[symbol][square] + eg_psqts[symbol][square]) / 2
+                    values[feature_index(color, piece, square)] = color_weight * (material_weight * material + psqt_weight * psqt)
+        return {"input_weights": np.stack([values, -values], axis = 1), "input_bias": np.zeros(2, dtype = np.float32), \
+                "hidden_weights": np.eye(2, dtype = np.float32), "hidden_bias": np.zeros(2, dtype = np.float32), \
+                "output_weights": np.array([1, -1], dtype = np.float32), "output_bias": np.float32(0)}
+
+    def load(self, weights_file):
+        """
+        Loads the weights from a .npz file, checking the layer sizes fit together
+        """
+        with np.load(weights_file) as data:
+            weights = {name: data[name].astype(np.float32) for name in \
+                       ("input_weights", "input_bias", "hidden_weights", "hidden_bias", "output_weights", "output_bias")}
+        accumulator_size = weights["input_weights"].shape[1]
+        hidden_size = weights["hidden_weights"].shape[1]
+        if weights["input_weights"].shape != (768, accumulator_size) or weights["input_bias"].shape != (accumulator_size,) \
+            or weights["hidden_weights"].shape != (accumulator_size, hidden_size) or weights["hidden_bias"].shape != (hidden_size,) \
+            or weights["output_weights"].shape != (hidden_size,) or weights["output_bias"].size != 1:
+            raise ValueError("Layer sizes in {} do not fit together".format(weights_file))
+        weights["output_bias"] = weights["output_bias"].reshape(())
+        self.weights = weights
+
+    def save(self, weights_file):
+        """
+        Saves the weights to a .npz file that load() reads
+        """
+        np.savez(weights_file, **self.weights)
+
+    def prepare(self, board):
+        board.accumulator = Accumulator(self.weights, board)
+
+    def evaluate(self, board, ctx = None, alpha = -INF, beta = INF):
+        game_state = get_game_state(board, ctx)
+        if game_state == 1: # Game is checkmate
+            return -MATE_SCORE
+        elif 2 <= game_state <= 5: # Game is drawn
+            return 0
+
+        if board.accumulator is None:
+            self.prepare(board)
+        weights = self.weights
+        hidden = np.maximum(np.maximum(board.accumulator.values, 0) @ weights["hidden_weights"] + weights["hidden_bias"], 0)
+        score = float(hidden @ weights["output_weights"] + weights["output_bias"])
+        board_weight = 1 if board.turn == chess.WHITE else -1
+        return score * board_weight + 1 # Add one so evaluations of 0 are not confused with draw scores
+
+
+# Evaluators selectable with the Evaluator UCI option
+evaluators = {ClassicalEvaluator.name: ClassicalEvaluator, AccumulatorEvaluator.name: AccumulatorEvaluator}
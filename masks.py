@@ -0,0 +1,59 @@
+"""
+Not Magnus
+Classical chess engine by Devin Zhang
+
+Bitboard masks used by the evaluation, computed once at import
+All masks are plain integers, so evaluation terms are bitwise AND and popcount
+"""
+import chess
+
+
+def make_king_zone(square, color):
+    """
+    King zone of a king of the given color on the square: the ring around the
+    king plus 3 more squares facing the enemy, clipped to the board
+    """
+    rank = chess.square_rank(square)
+    file = chess.square_file(square)
+    forward = 1 if color == chess.WHITE else -1
+
+    bb_ranks = chess.BB_EMPTY
+    for rank_offset in (-forward, 0, forward, 2 * forward):
+        if 0 <= rank + rank_offset <= 7:
+            bb_ranks |= chess.BB_RANKS[rank + rank_offset]
+    bb_files = chess.BB_FILES[file] | adjacent_files[file]
+    return bb_ranks & bb_files
+
+
+def make_front_span(square, color):
+    """
+    Squares in front of the square (from the point of view of color) on its file and the adjacent files
+    """
+    rank = chess.square_rank(square)
+    file = chess.square_file(square)
+    if color == chess.WHITE:
+        bb_front_ranks = chess.BB_ALL & ~((1 << (8 * (rank + 1))) - 1)
+    else:
+        bb_front_ranks = (1 << (8 * rank)) - 1
+    return bb_front_ranks & (chess.BB_FILES[file] | adjacent_files[file])
+
+
+# Files next to each file [file]
+adjacent_files = [(chess.BB_FILES[file - 1] if file > 0 else chess.BB_EMPTY) \
+                | (chess.BB_FILES[file + 1] if file < 7 else chess.BB_EMPTY) for file in range(8)]
+
+# King zone [color][square]
+king_zones = [[make_king_zone(square, color) for square in chess.SQUARES] for color in [chess.BLACK, chess.WHITE]]
+
+# Squares a pawn must get past to be passed, no enemy pawns there means it is passed [color][square]
+passed_pawn_spans = [[make_front_span(square, color) for square in chess.SQUARES] for color in [chess.BLACK, chess.WHITE]]
+
+# Squares a pawn of the color defends the square from [color][square]
+pawn_defenders = [[chess.BB_PAWN_ATTACKS[not color][square] for square in chess.SQUARES] for color in [chess.BLACK, chess.WHITE]]
+
+# Ranks a knight counts as being on an outpost, ranks 4 to 6 from each side's point of view [color]
+outpost_ranks = [chess.BB_RANK_5 | chess.BB_RANK_4 | chess.BB_RANK_3, chess.BB_RANK_4 | chess.BB_RANK_5 | chess.BB_RANK_6]
+
+# All squares with the same color as the square [square]
+square_colors = [chess.BB_LIGHT_SQUARES if chess.BB_SQUARES[square] & chess.BB_LIGHT_SQUARES else chess.BB_DARK_SQUARES \
+                 for square in chess.SQUARES]
@@ -0,0 +1,75 @@
+"""
+Not Magnus
+Classical chess engine by Devin Zhang
+
+Perft, counts the leaf nodes of the legal move tree to a fixed depth with the engine's own board,
+to check move generation and make/unmake and to measure their speed
+> python perft.py depth [fen] [--hash]
+"""
+import sys
+import time
+from search import *
+
+
+def perft(board, depth, hash_table = None):
+    """
+    Returns the number of leaf nodes depth plies below the position
+    Leaves are counted in bulk: at depth 1 the legal moves are counted without being made
+    With a PerftHashTable the counts of positions already seen at the same depth are reused
+    """
+    if depth <= 1:
+        if depth <= 0:
+            return 1
+        return len(list(board.generate_legal_moves()))
+
+    if hash_table:
+        count = hash_table.probe(board.zobrist, depth)
+        if count is not None:
+            return count
+
+    count = 0
+    for move in list(board.generate_legal_moves()):
+        board.push(move)
+        count += perft(board, depth - 1, hash_table)
+        board.pop()
+
+    if hash_table:
+        hash_table.store(board.zobrist, depth, count)
+    return count
+
+
+def divide(board, depth, hash_table = None, stop_event = None):
+    """
+    Sends the leaf count below each legal move of the position, then the total nodes, time, and nodes per second
+    Setting stop_event stops after the current root move
+    Returns the total nodes
+    """
+    depth = max(1, depth)
+    total_nodes = 0
+    start_time = time.time_ns()
+    for move in list(board.generate_legal_moves()):
+        if stop_event and stop_event.is_set():
+            break
+        board.push(move)
+        count = perft(board, depth - 1, hash_table)
+        board.pop()
+        total_nodes += count
+        send_output("{}: {}\n".format(move, count))
+
+    elapsed = max(time.time_ns() - start_time, 1)
+    send_output("\nNodes searched: {}\n".format(total_nodes))
+    send_output("Time (ms): {}\n".format(elapsed // 10**6))
+    send_output("Nodes/second: {}\n".format(int(total_nodes / (elapsed * 10**-9))))
+    if hash_table:
+        send_output("Perft hash hit rate: {:.1%}\n".format(hash_table.hit_rate()))
+    return total_nodes
+
+
+if __name__ == "__main__":
+    arguments = [argument for argument in sys.argv[1:] if argument != "--hash"]
+    if not arguments:
+        print("Usage: python perft.py depth [fen] [--hash]")
+        sys.exit(1)
+    perft_board = Board(" ".join(arguments[1:])) if len(arguments) > 1 else Board()
+    divide(perft_board, int(arguments[0]), PerftHashTable(PERFT_HASH_ENTRIES) if "--hash" in sys.argv else None)
+    ttable.release()
@@ -4,84 +4,224 @@ Learner classical chess engine by Devin Zhang
 
 Search functions which navigate the game tree
 """
+import multiprocessing
+import queue
+import random
+from itertools import chain
 from sys import stdout
-from evaluate import *
+from board import *
+from evaluators import *
+from batch import *
+from timeman import *
+from search_values import *
 
 
-def qsearch(board, alpha, beta, movetime = INF, stop = lambda: False):
+# Lazy SMP
+helpers = [] # (process, job queue) of each helper process
+helper_results = multiprocessing.Queue() # Results reported by helpers
+helper_stop = multiprocessing.Event() # Set to stop the helpers' searches
+helper_search_id = 0 # Id of the latest search given to the helpers, so a late result of an earlier search is ignored
+helper_poll_interval = 0.05 # Seconds between checks that the helpers still being waited for are alive
+helper_wait_limit = 1 # Seconds to wait for the helpers' results after they are stopped before using the main search's result
+helper_join_limit = 1 # Seconds to wait for a helper to exit when shutting down before it is terminated
+
+evaluator = ClassicalEvaluator() # Evaluation function the search calls through
+output_writer = None # Called with every line of output for the GUI, None writes straight to stdout
+
+
+def qsearch(board, alpha, beta, control, ctx = None, qply = 0, ply = 0):
     """
     Quiescence search to extend search depth until
     there are no more captures or checks
+
+    Only captures and promotions are generated, plus quiet checks on the first ply (qply 0).
+    When in check every evasion is searched instead
+    The static scores of all capture children are computed in one batch (see batch.py), they order
+    the captures after MVV-LVA, and delta pruning skips captures whose gain in static score cannot
+    raise alpha even with a safety margin. Captures that lose material by static exchange evaluation are skipped
+    ply is the distance from the root, checkmate scores MATE_SCORE - ply so shorter mates score higher
+    control is the SearchControl, once it stops the returned scores are meaningless and the caller discards them
     """
     global nodes
     
-    if can_exit_search(movetime, stop, start_time):
+    if control.stopped or (nodes >= control.next_check and control.check(nodes)):
         return 0
 
-    stand_pat = evaluate(board)
+    if not ctx:
+        ctx = MoveContext(board)
+    stand_pat = evaluator.evaluate(board, ctx, alpha, beta)
     nodes += 1
-    
-    if stand_pat >= beta:
-        return beta
-    if not board.is_check():
+
+    if ctx.in_check:
+        if not ctx.moves: # Checkmate
+            return -MATE_SCORE + ply
+        moves = sorted(ctx.moves, key = lambda move : rate(board, move, None, ctx), reverse = True)
+    else:
+        if stand_pat >= beta:
+            return beta
         alpha = max(alpha, stand_pat)
 
-    moves = list(board.generate_legal_moves())
-    moves.sort(key = lambda move : rate(board, move, None), reverse = True) # Significant improvements if sorted
+        # Captures, scored together, delta pruning drops the ones whose gain cannot raise alpha
+        captures = generate_qsearch_captures(board)
+        parent_score = static_score(board)
+        scored_captures = [(score - parent_score, move) for score, move in zip(score_moves(board, captures), captures) \
+                           if stand_pat + score - parent_score + delta_margin >= alpha]
+        scored_captures.sort(key = lambda scored : (mvv_lva(board, scored[1]), scored[0]), reverse = True)
+        moves = [move for gain, move in scored_captures]
+        if qply == 0:
+            moves = chain(moves, generate_quiet_checks(board))
+
     for move in moves:
-        if board.is_capture(move) or board.gives_check(move):
-            board.push(move)
-            score = -qsearch(board, -beta, -alpha, movetime, stop)
-            board.pop()
+        # Losing captures
+        if not ctx.in_check and not move.promotion and ctx.is_capture(move) and is_losing_capture(board, move):
+            continue
 
-            if score >= beta:
-                return beta
-            alpha = max(alpha, score)
+        board.push(move)
+        score = -qsearch(board, -beta, -alpha, control, None, qply + 1, ply + 1)
+        board.pop()
+        if control.stopped:
+            return 0
+
+        if score >= beta:
+            return beta
+        alpha = max(alpha, score)
 
     return alpha
 
 
-def negamax(board, depth, alpha, beta, movetime = INF, stop = lambda: False):
+def score_to_tt(score, ply):
+    """
+    Mate scores count plies from the root, in the transposition table they count from the position instead
     """
-    Searches the possible moves using negamax, alpha-beta pruning, transposition table,
-    quiescence search, null move pruning, and late move reduction
+    if score >= MATE_SCORE - MAX_PLY:
+        return score + ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    """
+    Converts a score stored by score_to_tt() back to count from the root
+    """
+    if score >= MATE_SCORE - MAX_PLY:
+        return score - ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score + ply
+    return score
+
+
+def tablebase_score(dtm, ply):
+    """
+    Search score of a tablebase position ply plies from the root, with dtm plies to mate (see tablebase.py)
+    """
+    if dtm > 0:
+        return MATE_SCORE - ply - dtm
+    if dtm < 0:
+        return -MATE_SCORE + ply - dtm
+    return 0
+
+
+def negamax(board, depth, alpha, beta, control, ply = 0):
+    """
+    Searches the possible moves using negamax, alpha-beta pruning, principal variation search,
+    transposition table, quiescence search, null move pruning, and late move reduction
     Initial psuedocode adapated from Jeroen W.T. Carolus
+    ply is the distance from the root, used to index the killer moves and principal variation tables
+
+    Principal variation search: the first move is searched with the full window, the rest with
+    a zero window (alpha, alpha + 1) that only proves them worse. A move that beats alpha anyway is
+    searched again, first without its late move reduction and then with the full window
+
+    Near the horizon, nodes outside the principal variation are also pruned by reverse futility pruning,
+    razoring, futility pruning, and late move pruning (margins are in search_values.py)
+
+    The endgame tablebase is only probed where a capture or pawn move just reset the halfmove clock,
+    as only those moves change the material and so which table the position is in. The root is probed by cpu_move()
+
+    Once the SearchControl control stops the search, every node returns (None, 0) as soon as its
+    current child returns, without storing anything in the transposition table or the move ordering tables
     """
     global nodes
     
-    if can_exit_search(movetime, stop, start_time):
+    if control.stopped or (nodes >= control.next_check and control.check(nodes)):
         return (None, 0)
 
-    key = board._transposition_key()
+    pv_table[ply] = []
+    if ply >= MAX_PLY - 1:
+        return (None, evaluator.evaluate(board))
+
+    key = board.zobrist
     tt_move = None
+    pv_node = beta - alpha > 1
 
     # Search for position in the transposition table
-    if key in ttable:
-        tt_depth, tt_move, tt_score, flag = ttable[key]
-        if tt_depth >= depth:
+    tt_entry = ttable.probe(key)
+    if tt_entry:
+        tt_depth, tt_move, tt_score, flag = tt_entry
+        tt_score = score_from_tt(tt_score, ply)
+        if tt_depth >= depth and not pv_node: # Cut-offs in PV nodes would cut the principal variation short
             if tt_score != 0: # Prevent mistakingly detecting this position as draw by repetition due to transposition in another branch
                 nodes += 1
-                if flag == "EXACT":
+                if flag == EXACT:
                     return (tt_move, tt_score)
-                elif flag == "LOWERBOUND":
+                elif flag == LOWERBOUND:
                     alpha = max(alpha, tt_score)
-                elif flag == "UPPERBOUND":
+                elif flag == UPPERBOUND:
                     beta = min(beta, tt_score)
                 if alpha >= beta:
                     return (tt_move, tt_score)
 
     old_alpha = alpha
-    if depth <= 0 or is_game_over(board):
-        score = qsearch(board, alpha, beta, movetime, stop)
+    ctx = MoveContext(board)
+
+    # Whether the game is over, checked once for the tablebase probe and the horizon
+    tablebase_probe = ply and board.halfmove_clock == 0 and tablebase.available(board)
+    game_over = (depth > 0 or tablebase_probe) and is_game_over(board, ctx)
+
+    # Endgame tablebase
+    if tablebase_probe and not game_over:
+        dtm = tablebase.probe_dtm(board)
+        if dtm is not None:
+            nodes += 1
+            score = tablebase_score(dtm, ply)
+            ttable.store(key, MAX_PLY, None, score_to_tt(score, ply), EXACT) # Exact at any depth
+            return (None, score)
+
+    if depth <= 0 or game_over:
+        score = qsearch(board, alpha, beta, control, ctx, 0, ply)
         return (None, score)
     else:
+        # Static evaluation for pruning near the horizon, not trusted in check or near mate scores
+        static_eval = None
+        futility_pruning = False
+        if not pv_node and not ctx.in_check and depth < len(reverse_futility_margins) and abs(beta) < MATE_SCORE - MAX_PLY:
+            static_eval = evaluator.evaluate(board, ctx, alpha, beta)
+
+            # Reverse futility pruning
+            if static_eval - reverse_futility_margins[depth] >= beta:
+                return (None, static_eval)
+
+            # Razoring
+            if depth < len(razoring_margins) and static_eval + razoring_margins[depth] < alpha:
+                score = qsearch(board, alpha, beta, control, ctx, 0, ply)
+                if control.stopped:
+                    return (None, 0)
+                if score < alpha:
+                    return (None, score)
+
+            # Futility pruning, applied to quiet moves below
+            futility_pruning = depth < len(futility_margins) and static_eval + futility_margins[depth] <= alpha
+
         # Null move pruning
-        if null_move_ok(board):
-            null_move_depth_reduction = 2
+        if not pv_node and null_move_ok(board, ctx):
+            null_move_depth_reduction = null_move_base_reduction + depth // null_move_depth_divisor
             board.push(chess.Move.null())
-            score = -negamax(board, depth - 1 - null_move_depth_reduction, -beta, -beta + 1, movetime, stop)[1]
+            score = -negamax(board, depth - 1 - null_move_depth_reduction, -beta, -beta + 1, control, ply + 1)[1]
             board.pop()
             nodes -= 1
+            if control.stopped:
+                return (None, 0)
             if score >= beta:
                 return (None, score)
 
@@ -89,145 +229,391 @@ def negamax(board, depth, alpha, beta, movetime = INF, stop = lambda: False):
         score = -INF
         best_move = None
         best_score = -INF
-        moves = board.generate_legal_moves()
-        moves = sorted(moves, key = lambda move : rate(board, move, tt_move), reverse = True)
-
         moves_searched = 0
         has_failed_high = False
 
-        for move in moves:
+        for move in pick_moves(board, ctx, tt_move, ply):
+            quiet = not move.promotion and not ctx.is_capture(move)
             board.push(move)
 
-            # Append to threefold repetition table
-            if key in rtable:
-                rtable[key] += 1
+            # Futility pruning and late move pruning of quiet moves
+            if moves_searched > 0 and quiet and not ctx.in_check and not board.is_check():
+                if futility_pruning:
+                    board.pop()
+                    best_score = max(best_score, static_eval + futility_margins[depth])
+                    continue
+                if not pv_node and depth < len(late_move_pruning_counts) and moves_searched >= late_move_pruning_counts[depth]:
+                    board.pop()
+                    continue
+
+            if moves_searched == 0:
+                score = -negamax(board, depth - 1, -beta, -alpha, control, ply + 1)[1]
             else:
-                rtable[key] = 1
-            
-            # Late move reduction
-            late_move_depth_reduction = 0
-            if reduction_ok(board, depth, move, moves_searched, has_failed_high):
-                late_move_depth_reduction = 1
-
-            score = -negamax(board, depth - 1 - late_move_depth_reduction, -beta, -alpha, movetime, stop)[1]
+                # Late move reduction
+                late_move_depth_reduction = 0
+                if reduction_ok(board, depth, move, moves_searched, has_failed_high, ctx):
+                    late_move_depth_reduction = lmr_table[min(depth, 63)][min(moves_searched, 63)]
+                    late_move_depth_reduction = max(1, min(late_move_depth_reduction - pv_node, depth - 2))
+
+                score = -negamax(board, depth - 1 - late_move_depth_reduction, -alpha - 1, -alpha, control, ply + 1)[1]
+                if score > alpha and late_move_depth_reduction and not control.stopped:
+                    score = -negamax(board, depth - 1, -alpha - 1, -alpha, control, ply + 1)[1]
+                if alpha < score < beta and not control.stopped:
+                    score = -negamax(board, depth - 1, -beta, -alpha, control, ply + 1)[1]
             moves_searched += 1
 
             board.pop()
-
-            # Remove from threefold repetition table
-            rtable[key] -= 1
+            if control.stopped:
+                return (None, 0)
 
             if score > best_score:
                 best_move = move
                 best_score = score
 
-            alpha = max(alpha, best_score)
+            if best_score > alpha:
+                alpha = best_score
+                pv_table[ply] = [move] + pv_table[ply + 1] # This move followed by the child's principal variation
 
             if alpha >= beta: # Beta cut-off (fails high)
                 has_failed_high = True
-                if not board.is_capture(move):
-                    htable[board.piece_at(move.from_square).color][move.from_square][move.to_square] += depth**2 # Update history heuristic table
+                if not ctx.is_capture(move):
+                    htable[board.turn][move.from_square][move.to_square] += depth**2 # Update history heuristic table
+                    update_killers(ply, move)
                 break
         
         # Add position to the transposition tables
         if best_score <= old_alpha:
-            tt_flag = "UPPERBOUND"
+            tt_flag = UPPERBOUND
         elif best_score >= beta:
-            tt_flag = "LOWERBOUND"
+            tt_flag = LOWERBOUND
         else:
-            tt_flag = "EXACT"
-
-        # Increment mate score by depth so ie M1 is preferred over M2
-        if best_score <= -MATE_SCORE: # TODO play into longest mating sequence if on losing side?
-            best_score += depth
+            tt_flag = EXACT
 
-        ttable[key] = (depth, best_move, best_score, tt_flag)
+        ttable.store(key, depth, best_move, score_to_tt(best_score, ply), tt_flag)
 
         return (best_move, best_score)
         
 
-def iterative_deepening(board, depth, movetime = INF, stop = lambda: False):
+def iterative_deepening(board, depth, control, start_depth = 1, output = True, time_manager = None, final_output = True):
     """
     Approaches the desired search depth in steps, maintaining effiency
     with the transposition table
+    Returns the best move, its score, the last depth that was searched, and the principal variation
+    start_depth lets Lazy SMP helpers search different depths than the main search
+    Info is printed after each depth unless output is false, and once more at the end unless final_output is also false
+    The time manager, if given, decides whether to start each new iteration and stops once a wanted mate is found
+    An iteration stopped by the SearchControl is thrown away, the result of the last completed one is kept
     """
     global nodes
     global start_time
     
     move = None
     score = -INF
+    pv = []
     d = 0
-    for d in range(1, depth + 1):
-        if can_exit_search(movetime, stop, start_time):
+    completed_depth = 0
+    aspiration_window = 250 # Initial distance of alpha and beta from the previous iteration's score
+    for d in range(start_depth, depth + 1):
+        if control.stopped or control.check(nodes):
+            break
+        if time_manager and completed_depth and not time_manager.can_start_iteration():
             break
 
-        move, score = negamax(board, d, -MATE_SCORE, MATE_SCORE, movetime, stop)
+        # Aspiration window around the previous score, widened on a fail high or fail low until the score fits
+        window = aspiration_window
+        if completed_depth and abs(score) < MATE_SCORE - MAX_PLY:
+            alpha, beta = score - window, score + window
+        else:
+            alpha, beta = -MATE_SCORE, MATE_SCORE
+        while True:
+            search_move, search_score = negamax(board, d, alpha, beta, control)
+            if control.stopped:
+                break
+            if search_score <= alpha and alpha > -MATE_SCORE:
+                window *= 2
+                alpha = max(search_score - window, -MATE_SCORE)
+            elif search_score >= beta and beta < MATE_SCORE:
+                window *= 2
+                beta = min(search_score + window, MATE_SCORE)
+            else:
+                break
 
-        if not can_exit_search(movetime, stop, start_time):
-            stdout.write(uci_output(move, score, d, nodes, start_time))
-            stdout.flush()
+        if not control.stopped:
+            move, score = search_move, search_score
+            pv = pv_table[0] if pv_table[0] and pv_table[0][0] == move else [move]
+            completed_depth = d
+            if output:
+                send_output(uci_output(pv, score, d, nodes, start_time))
+            if time_manager:
+                time_manager.iteration_done(move)
+                if time_manager.mate_found(score):
+                    break
+        elif not move: # Stopped during the first iteration, any legal move is better than no move at all
+            tt_entry = ttable.probe(board.zobrist)
+            move = tt_entry[1] if tt_entry and tt_entry[1] and board.is_legal(tt_entry[1]) else next(iter(board.legal_moves), None)
+            score = 0
+            pv = [move] if move else []
 
     # Print out info
-    stdout.write(uci_output(move, score, d, nodes, start_time))
-    stdout.flush()
-    stdout.write("bestmove {}\n".format(move))
-    stdout.flush()
+    if output and final_output:
+        send_output(uci_output(pv, score, completed_depth or start_depth, nodes, start_time))
 
-    return (move, score)
-    
-    
-def cpu_move(board, depth, movetime = INF, stop = lambda: False):
+    return (move, score, completed_depth, pv)
+
+
+def helper_main(jobs, results, helper_stop, tt_name, tt_size_mb, helper_id, search_evaluator, search_tablebase):
     """
-    Chooses a move for the CPU
-    If inside opening book make book move
-    If inside Gaviota tablebase make tablebase move
-    Else search for a move
+    Main loop of a Lazy SMP helper process
+    Waits for a search job, searches it silently into the shared transposition table,
+    and reports the result until given None
+    Helpers with an odd id skip the first depth, and each helper starts from slightly
+    different history scores, so the helpers search the tree in different orders
     """
-    global OPENING_BOOK
-    global ttable
-    global htable
-
     global nodes
     global start_time
-    
-    nodes = 0
-    start_time = time.time_ns()
+    global evaluator
+    global tablebase
+
+    ttable.attach(tt_name, tt_size_mb)
+    evaluator = search_evaluator
+    tablebase = search_tablebase
+    random.seed(helper_id)
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        search_id, fen, moves, depth, hard_limit, generation = job
 
-    if OPENING_BOOK:
-        try:
-            with chess.polyglot.open_reader(OPENING_BOOK_LOCATION) as opening_book: # https://sourceforge.net/projects/codekiddy-chess/files/
-                opening = opening_book.choice(board)
-                opening_book.close()
-                return opening.move
-        except:
-            OPENING_BOOK = False
-
-    if ENDGAME_BOOK and get_num_pieces(board) <= 5:
-        evals = []
-        for move in list(board.legal_moves):
-            board.push(move)
-            score = eval_endgame(board)
-            board.pop()
-            evals.append((move, score))
-        move = max(evals, key = lambda eval : eval[1])[0]
+        board = Board(fen)
+        for move in moves:
+            board.push_uci(move)
+        board.search_root = len(board.zobrist_stack)
+        evaluator.prepare(board)
 
-        # Append to threefold repetition table
-        board.push(move)
-        if board._transposition_key() in rtable:
-            rtable[board._transposition_key()] += 1
-        board.pop()
+        nodes = 0
+        start_time = time.time_ns()
+        ttable.generation = generation
+        clear_move_ordering()
+        for side in htable:
+            for from_square in side:
+                for to_square in range(64):
+                    from_square[to_square] = random.randint(0, helper_id)
+
+        control = SearchControl(hard_limit, None, helper_stop, start_time)
+        move, score, completed_depth, pv = iterative_deepening(board, depth, control, 1 + helper_id % 2, False)
+        results.put((helper_id, search_id, move.uci() if move else None, score, completed_depth, nodes, [pv_move.uci() for pv_move in pv]))
+
+    ttable.release()
+    tablebase.close()
+
+
+def start_helpers(threads):
+    """
+    Starts threads - 1 Lazy SMP helper processes that search alongside the main search
+    The transposition table is moved to shared memory so every process reads and writes the same table
+    """
+    stop_helpers()
+    if threads <= 1:
+        return
 
-        return move
+    tt_name = ttable.share()
+    for helper_id in range(1, threads):
+        jobs = multiprocessing.Queue()
+        process = multiprocessing.Process(target = helper_main, daemon = True, \
+                                          args = (jobs, helper_results, helper_stop, tt_name, ttable.size_mb, helper_id, evaluator, tablebase))
+        process.start()
+        helpers.append((process, jobs))
+
+
+def stop_helpers():
+    """
+    Shuts down all Lazy SMP helper processes
+    A helper that has not exited within helper_join_limit is terminated, and killed if that does not end it
+    """
+    helper_stop.set()
+    for process, jobs in helpers:
+        jobs.put(None)
+    join_end = time.time() + helper_join_limit
+    for process, jobs in helpers:
+        process.join(max(0, join_end - time.time()))
+        if process.is_alive():
+            process.terminate()
+            process.join(helper_join_limit)
+        if process.is_alive(): # Stopped processes ignore terminate() until they continue
+            process.kill()
+            process.join()
+    helpers.clear()
+
+
+def send_output(text):
+    """
+    Sends text to the GUI through the output writer, or straight to stdout without one
+    """
+    if output_writer:
+        output_writer(text)
+    else:
+        stdout.write(text)
+        stdout.flush()
 
-    move = iterative_deepening(board, depth, movetime, stop)[0]
 
-    ttable.clear()
-    htable = [[[0 for x in range(64)] for y in range(64)] for z in range(2)] # Reset history heuristic table
+def set_output_writer(writer):
+    """
+    Sends the search's output to the writer instead of stdout, the writer is called from the search thread
+    """
+    global output_writer
+
+    output_writer = writer
+
+
+def set_evaluator(name, weights_file = None):
+    """
+    Switches the search to the evaluator with the given name, loading its weights from the file if given
+    Helper processes are restarted to use it
+    """
+    global evaluator
+
+    evaluator = evaluators[name](weights_file)
+    if helpers:
+        start_helpers(len(helpers) + 1)
+
+
+def lazy_smp(board, depth, control, time_manager = None):
+    """
+    Lazy SMP: every helper process searches the same root position, and they share work
+    only through the transposition table
+    The main search runs in this process and prints info, once it finishes the helpers are stopped,
+    and the result from the deepest completed search is played (the main search wins ties)
+    A helper that died or does not report within helper_wait_limit is left out
+    """
+    global nodes
+    global helper_search_id
+
+    helper_search_id += 1
+    helper_stop.clear()
+    job = (helper_search_id, board.root().fen(), [move.uci() for move in board.move_stack], depth, control.hard_limit, ttable.generation)
+    for process, jobs in helpers:
+        jobs.put(job)
 
-    # Append to threefold repetition table
+    move, score, completed_depth, pv = iterative_deepening(board, depth, control, time_manager = time_manager, final_output = False)
+    helper_stop.set()
+
+    waiting = set(range(1, len(helpers) + 1)) # Ids of the helpers whose results have not come yet
+    wait_end = time.time() + helper_wait_limit
+    while waiting:
+        try:
+            helper_id, search_id, helper_move, helper_score, helper_depth, helper_nodes, helper_pv = helper_results.get(timeout = helper_poll_interval)
+        except queue.Empty:
+            waiting = {helper_id for helper_id in waiting if helpers[helper_id - 1][0].is_alive()}
+            if waiting and time.time() > wait_end:
+                send_output("info string {} Lazy SMP helpers did not report, their results are left out\n".format(len(waiting)))
+                break
+            continue
+        if search_id != helper_search_id or helper_id not in waiting:
+            continue
+        waiting.remove(helper_id)
+        nodes += helper_nodes
+        if helper_move and helper_depth > completed_depth:
+            move, score, completed_depth = chess.Move.from_uci(helper_move), helper_score, helper_depth
+            pv = [chess.Move.from_uci(pv_move) for pv_move in helper_pv] or [move]
+
+    send_output(uci_output(pv, score, completed_depth or 1, nodes, start_time))
+    return (move, score, completed_depth, pv)
+    
+    
+def tablebase_move(board):
+    """
+    Returns the move with the best endgame tablebase score and that score, probing the position after
+    every legal move, or (None, 0) if any of them is not in the tablebase
+    """
+    best_move = None
+    best_score = -INF
+    for move in list(board.legal_moves):
+        board.push(move)
+        if board.is_checkmate(): # The tablebase scores checkmates as 0 like draws
+            score = MATE_SCORE - 1
+        else:
+            dtm = tablebase.probe_dtm(board)
+            score = -tablebase_score(dtm, 1) if dtm is not None else None
+        board.pop()
+        if score is None:
+            return (None, 0)
+        if score > best_score:
+            best_move, best_score = move, score
+    return (best_move, best_score)
+
+
+def get_ponder_move(board, move, pv = ()):
+    """
+    Returns the expected reply to the move, the second move of the principal variation pv
+    When the principal variation is shorter, the best move stored in the transposition table for the
+    position after the move is used instead, or None if there is no legal one
+    """
+    if not move:
+        return None
+    if len(pv) >= 2 and pv[0] == move:
+        return pv[1]
     board.push(move)
-    if board._transposition_key() in rtable:
-        rtable[board._transposition_key()] += 1
+    tt_entry = ttable.probe(board.zobrist)
+    ponder_move = tt_entry[1] if tt_entry and tt_entry[1] and board.is_legal(tt_entry[1]) else None
     board.pop()
+    return ponder_move
+
+
+def cpu_move(board, depth, movetime = INF, stop_event = None, time_manager = None):
+    """
+    Chooses a move for the CPU
+    If inside opening book make book move
+    If inside Gaviota tablebase make tablebase move
+    Else search for a move
+    The time manager holds the time, node, and mate limits (see timeman.py), without one the search uses movetime
+    Setting stop_event (a threading or multiprocessing event) stops the search
+    When pondering the move is not sent before ponderhit or stop, and the transposition table and the
+    history are kept warm for the next search
+    """
+    global nodes
+    global start_time
+    
+    if not time_manager:
+        time_manager = TimeManager(movetime = None if movetime == INF else movetime)
+    nodes = 0
+    start_time = time_manager.start_time
+    control = SearchControl(*time_manager.search_limits(), stop_event, start_time)
+    time_manager.control = control
+    ttable.new_search()
+
+    pv = []
+    move = opening_book.choose(board)
+    if move:
+        send_output("info string Book move {}\n".format(move))
+    elif tablebase.available(board):
+        move, score = tablebase_move(board)
+        if move:
+            send_output(uci_output([move], score, 1, nodes, start_time))
+
+    if not move:
+        board.search_root = len(board.zobrist_stack) # Repetitions after this point are draws
+        evaluator.prepare(board)
+        if helpers:
+            move, score, completed_depth, pv = lazy_smp(board, depth, control, time_manager)
+        else:
+            move, score, completed_depth, pv = iterative_deepening(board, depth, control, time_manager = time_manager)
+        board.search_root = NO_SEARCH
+
+    # Reported once, the book and tablebase stay disabled until they are enabled again
+    if opening_book.error:
+        send_output("info string Opening book disabled: {}\n".format(opening_book.error))
+        opening_book.error = None
+    if tablebase.error:
+        send_output("info string Endgame tablebase disabled: {}\n".format(tablebase.error))
+        tablebase.error = None
+
+    age_move_ordering()
+    ponder_move = get_ponder_move(board, move, pv)
+    time_manager.wait_for_ponderhit(stop_event)
+
+    if ponder_move:
+        send_output("bestmove {} ponder {}\n".format(move, ponder_move))
+    else:
+        send_output("bestmove {}\n".format(move))
 
     return move
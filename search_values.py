@@ -0,0 +1,48 @@
+"""
+Not Magnus
+Classical chess engine by Devin Zhang
+The values used to tune the search
+"""
+import math
+from evaluation_values import *
+
+# Margins are in evaluation units, where a pawn is worth material_values[0] * material_weight
+pawn_unit = material_values[0] * material_weight
+
+# Null move pruning, reduction of R = base + depth / divisor
+null_move_base_reduction = 2
+null_move_depth_divisor = 6
+
+# Late move reduction, reduction of base + ln(depth) * ln(moves searched) / divisor
+lmr_base = 0.75
+lmr_divisor = 2.25
+lmr_table = [[0] + [int(lmr_base + math.log(depth) * math.log(moves) / lmr_divisor) for moves in range(1, 64)] \
+             if depth else [0] * 64 for depth in range(64)] # [depth][moves searched]
+
+# Reverse futility pruning, cut when the static evaluation beats beta by the margin of the remaining depth
+reverse_futility_margins = (0, 1 * pawn_unit, 2 * pawn_unit, 3 * pawn_unit, 4 * pawn_unit) # [depth]
+
+# Futility pruning, skip quiet moves when the static evaluation plus the margin cannot reach alpha
+futility_margins = (0, 1.5 * pawn_unit, 3 * pawn_unit, 4.5 * pawn_unit) # [depth]
+
+# Razoring, drop into quiescence search when the static evaluation is far below alpha
+razoring_margins = (0, 3 * pawn_unit, 4 * pawn_unit) # [depth]
+
+# Late move pruning, skip the remaining quiet moves after this many moves were searched
+late_move_pruning_counts = (0, 5, 8, 13, 20) # [depth]
+
+# Delta pruning in quiescence search, largest positional swing a capture is expected to cause
+delta_margin = 2 * pawn_unit
+
+# Time management, times are in milliseconds
+move_overhead = 30 # Kept back from the clock for communication delays
+default_moves_to_go = 30 # Moves the remaining clock is split over when the GUI does not say
+increment_usage = 0.75 # Fraction of the increment added to the time for this move
+hard_limit_factor = 4 # The hard limit is this many times the soft limit,
+max_time_usage = 0.75 # but never more than this fraction of the remaining clock
+best_move_change_extension = 1.5 # The soft limit grows by this factor when the best move changes between iterations
+iteration_growth = 2 # Expected time of an iteration relative to the one before, until there are two iterations to compare
+
+# Search control, how often a running search checks the clock and the stop signal
+control_poll_time = 5 # Milliseconds wanted between checks, the number of nodes between checks follows the measured speed
+control_max_interval = 4096 # Most nodes between checks
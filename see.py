@@ -0,0 +1,92 @@
+"""
+Not Magnus
+Classical chess engine by Devin Zhang
+
+Static exchange evaluation, the material won or lost by a sequence of captures on one square
+"""
+import chess
+
+
+# Piece values for exchanges indexed by piece type, the king is worth more than everything else
+# combined so capturing into a defended square with the king is never good
+see_values = (0, 100, 320, 330, 500, 900, 20000)
+
+
+def get_attackers(board, square, occupied):
+    """
+    Bitboard of pieces of both colors attacking the square, with sliding
+    attacks computed through the given occupancy so x-rays are seen once
+    the pieces in front are removed
+    """
+    rank_file_sliders = board.rooks | board.queens
+    diag_sliders = board.bishops | board.queens
+    return (chess.BB_KNIGHT_ATTACKS[square] & board.knights) \
+         | (chess.BB_KING_ATTACKS[square] & board.kings) \
+         | (chess.BB_PAWN_ATTACKS[chess.WHITE][square] & board.pawns & board.occupied_co[chess.BLACK]) \
+         | (chess.BB_PAWN_ATTACKS[chess.BLACK][square] & board.pawns & board.occupied_co[chess.WHITE]) \
+         | (chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] & rank_file_sliders) \
+         | (chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied] & rank_file_sliders) \
+         | (chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied] & diag_sliders)
+
+
+def see(board, move):
+    """
+    Returns the net material (in centipawns) the side to move wins by playing the capture
+    and then both sides recapturing on the target square with their least valuable attacker,
+    each side free to stop when continuing would lose material
+    Pins are ignored
+    """
+    from_square = move.from_square
+    to_square = move.to_square
+    occupied = board.occupied
+
+    # First capture
+    if board.is_en_passant(move):
+        victim = chess.PAWN
+        occupied ^= chess.BB_SQUARES[to_square - 8 if board.turn == chess.WHITE else to_square + 8]
+    else:
+        victim = board.piece_type_at(to_square) or 0
+    attacker = board.piece_type_at(from_square)
+    gains = [see_values[victim]]
+    if move.promotion:
+        gains[0] += see_values[move.promotion] - see_values[chess.PAWN]
+        attacker = move.promotion
+    occupied ^= chess.BB_SQUARES[from_square]
+
+    # Recaptures, alternating sides
+    side = not board.turn
+    attackers = get_attackers(board, to_square, occupied) & occupied
+    while True:
+        side_attackers = attackers & board.occupied_co[side]
+        if not side_attackers:
+            break
+
+        # Least valuable attacker
+        for piece_bb, piece in ((board.pawns, chess.PAWN), (board.knights, chess.KNIGHT), (board.bishops, chess.BISHOP), \
+                                (board.rooks, chess.ROOK), (board.queens, chess.QUEEN), (board.kings, chess.KING)):
+            if side_attackers & piece_bb:
+                attacker_bb = side_attackers & piece_bb
+                attacker_bb &= -attacker_bb # Lowest set bit
+                break
+
+        gains.append(see_values[attacker] - gains[-1])
+        attacker = piece
+        occupied ^= attacker_bb
+        attackers = get_attackers(board, to_square, occupied) & occupied # Sliders behind the removed piece join in
+        side = not side
+
+    # Each side chooses whether to continue the exchange, starting from the end
+    for i in range(len(gains) - 1, 0, -1):
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
+
+
+def is_losing_capture(board, move):
+    """
+    Returns true if the capture loses material by static exchange evaluation
+    Captures of a piece worth at least as much as the capturing piece are never losing
+    """
+    victim = board.piece_type_at(move.to_square) or chess.PAWN
+    if move.promotion or see_values[victim] >= see_values[board.piece_type_at(move.from_square)]:
+        return False
+    return see(board, move) < 0
@@ -0,0 +1,131 @@
+"""
+Not Magnus
+Classical chess engine by Devin Zhang
+
+Gaviota endgame tablebase kept open for the whole process, with a cache of probe results
+"""
+from collections import OrderedDict
+import os
+import chess
+import chess.gaviota
+
+
+class Tablebase:
+    """
+    Gaviota endgame tablebase (https://chess.cygnitec.com/tablebases/gaviota/)
+
+    The tablebase files are opened on the first probe and stay open until close(). A process forked
+    from the one that opened them opens its own handle, as the file positions would otherwise be shared.
+    If the files cannot be opened the tablebase is disabled and the reason is kept in error.
+
+    Probe results are kept in a least recently used cache of at most cache_entries positions,
+    keyed by the position's Zobrist key. Positions without a table are cached as None.
+    DTM is the number of plies to mate from the side to move's point of view: positive when winning,
+    negative when losing, and 0 for a draw. WDL is its sign.
+    """
+
+    def __init__(self, location, enabled = False, cache_entries = 1 << 16, max_pieces = 5):
+        self.location = location
+        self.enabled = enabled
+        self.cache_entries = cache_entries
+        self.max_pieces = max_pieces
+        self.handle = None
+        self.pid = None # Process that opened the handle
+        self.error = None
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        """
+        Copies the settings but not the open handle or the cache, for helper processes
+        """
+        state = self.__dict__.copy()
+        state.update(handle = None, pid = None, cache = OrderedDict(), hits = 0, misses = 0)
+        return state
+
+    def open(self):
+        """
+        Opens the tablebase files, or disables the tablebase if they cannot be opened
+        Returns true if the tablebase is open
+        """
+        if self.handle is not None and self.pid == os.getpid():
+            return True
+        self.handle = None
+        try:
+            self.handle = chess.gaviota.open_tablebase(self.location)
+            self.pid = os.getpid()
+            self.error = None
+        except (OSError, RuntimeError) as error:
+            self.enabled = False
+            self.error = error
+        return self.handle is not None
+
+    def close(self):
+        """
+        Closes the tablebase files, they are opened again by the next probe
+        """
+        if self.handle is not None and self.pid == os.getpid():
+            self.handle.close()
+        self.handle = None
+        self.pid = None
+
+    def set_location(self, location):
+        """
+        Uses the tablebase files in another folder, clearing the cache
+        """
+        self.close()
+        self.location = location
+        self.clear()
+
+    def clear(self):
+        """
+        Empties the cache and resets the counters
+        """
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def available(self, board):
+        """
+        Returns true if the position may be in the tablebase: few enough pieces and no castling rights
+        """
+        return self.enabled and board.occupied.bit_count() <= self.max_pieces and not board.castling_rights
+
+    def probe_dtm(self, board):
+        """
+        Returns the DTM of the position, or None if it is not in the tablebase
+        """
+        if not self.available(board):
+            return None
+        key = board.zobrist
+        cache = self.cache
+        if key in cache:
+            self.hits += 1
+            cache.move_to_end(key)
+            return cache[key]
+
+        self.misses += 1
+        if not self.open():
+            return None
+        dtm = self.handle.get_dtm(board)
+        cache[key] = dtm
+        if len(cache) > self.cache_entries:
+            cache.popitem(last = False)
+        return dtm
+
+    def probe_wdl(self, board):
+        """
+        Returns 1 if the side to move wins, 0 for a draw, -1 if it loses, or None if the position is not in the tablebase
+        """
+        dtm = self.probe_dtm(board)
+        if dtm is None:
+            return None
+        return (dtm > 0) - (dtm < 0)
+
+    def hit_rate(self):
+        """
+        Returns the fraction of probes that were answered by the cache
+        """
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0
@@ -0,0 +1,153 @@
+"""
+Not Magnus
+Classical chess engine by Devin Zhang
+
+Time manager, decides how long a search may run from the UCI go limits,
+and the search control that stops a running search
+"""
+import time
+import chess
+from search_values import *
+
+
+class TimeManager:
+    """
+    Time, node, and mate limits of one search
+
+    - The hard limit aborts the search in the middle of an iteration
+    - The soft limit is the time the search is meant to use, no iteration is started after it.
+      It grows when the best move changes between iterations, up to the hard limit
+    - An iteration is also not started if it is not expected to finish before the hard limit,
+      going by how much longer each iteration took than the one before
+
+    With a clock (wtime/btime) the soft limit is the remaining time split over the moves to go plus most of the increment.
+    movetime gives equal soft and hard limits, and with neither the search only stops on depth, nodes, mate, or stop
+
+    When pondering (go ponder) there are no time limits until ponderhit() is called, then the limits
+    count from the ponderhit. control is the SearchControl of the running search, updated on ponderhit
+    """
+
+    def __init__(self, turn = chess.WHITE, wtime = None, btime = None, winc = 0, binc = 0, movestogo = None, \
+                 movetime = None, nodes = None, mate = None, ponder = False):
+        self.start_time = time.time_ns()
+        self.nodes = nodes
+        self.mate = mate
+        self.pondering = ponder
+        self.control = None
+        self.iteration_times = [] # Time each completed iteration took
+        self.last_iteration_end = self.start_time
+        self.best_move = None
+
+        time_left = wtime if turn == chess.WHITE else btime
+        increment = (winc if turn == chess.WHITE else binc) or 0
+        if movetime is not None:
+            self.soft_limit = self.hard_limit = max(1, movetime - move_overhead)
+        elif time_left is not None:
+            available = max(1, time_left - move_overhead)
+            soft_limit = available / (movestogo or default_moves_to_go) + increment * increment_usage
+            self.hard_limit = max(1, min(soft_limit * hard_limit_factor, available * max_time_usage))
+            self.soft_limit = min(soft_limit, self.hard_limit)
+        else:
+            self.soft_limit = self.hard_limit = float("inf")
+
+    def elapsed(self):
+        """
+        Milliseconds since the search started
+        """
+        return (time.time_ns() - self.start_time) * 10**-6
+
+    def can_start_iteration(self):
+        """
+        Returns true if there is time left to start and finish another iteration
+        """
+        if self.pondering:
+            return True
+        elapsed = self.elapsed()
+        if elapsed >= self.soft_limit:
+            return False
+        if not self.iteration_times:
+            return True
+        if len(self.iteration_times) >= 2 and self.iteration_times[-2] > 0:
+            growth = min(max(iteration_growth, self.iteration_times[-1] / self.iteration_times[-2]), 3 * iteration_growth) # Short iterations are noisy
+        else:
+            growth = iteration_growth
+        return elapsed + self.iteration_times[-1] * growth <= self.hard_limit
+
+    def iteration_done(self, move):
+        """
+        Records that an iteration finished with the best move, extending the soft limit if the move changed
+        """
+        now = time.time_ns()
+        self.iteration_times.append((now - self.last_iteration_end) * 10**-6)
+        self.last_iteration_end = now
+        if self.best_move is not None and move != self.best_move:
+            self.soft_limit = min(self.soft_limit * best_move_change_extension, self.hard_limit)
+        self.best_move = move
+
+    def search_limits(self):
+        """
+        Returns the hard limit and node limit for the SearchControl, no time limit while pondering
+        """
+        return (float("inf") if self.pondering else self.hard_limit, self.nodes)
+
+    def ponderhit(self):
+        """
+        The opponent played the move being pondered on, the search goes on under the normal limits from now
+        """
+        self.start_time = time.time_ns()
+        self.pondering = False
+        control = self.control
+        if control:
+            control.start_time = self.start_time
+            control.hard_limit = self.hard_limit
+
+    def wait_for_ponderhit(self, stop_event = None):
+        """
+        Waits while pondering until ponderhit or a stop request, a search that finished early must not send its move before
+        """
+        while self.pondering and not (stop_event and stop_event.is_set()):
+            time.sleep(0.01)
+
+    def mate_found(self, score):
+        """
+        Returns true if searching for a mate (go mate) and the score is a mate in at most that many moves
+        """
+        return bool(self.mate) and not self.pondering and score >= MATE_SCORE - MAX_PLY and (MATE_SCORE - score + 1) // 2 <= self.mate
+
+
+class SearchControl:
+    """
+    Tells a running search when to stop: on a stop request, at the hard time limit, or at the node limit
+
+    The search reads the stopped flag at every node and only calls check() once nodes reaches next_check,
+    so the clock is read every few milliseconds instead of at every node. The number of nodes between checks
+    is adapted to the measured nodes per second.
+    stop_event is any event with is_set() (threading or multiprocessing), so helper processes can share it
+    """
+
+    def __init__(self, hard_limit = float("inf"), node_limit = None, stop_event = None, start_time = None):
+        self.start_time = start_time or time.time_ns()
+        self.hard_limit = hard_limit
+        self.node_limit = node_limit
+        self.stop_event = stop_event
+        self.stopped = False
+        self.next_check = 1
+        self.last_check = (self.start_time, 0) # Time and node count of the previous check, to measure the speed
+
+    def check(self, nodes):
+        """
+        Checks the stop request and limits, sets and returns the stopped flag, and schedules the next check
+        """
+        now = time.time_ns()
+        elapsed = (now - self.start_time) * 10**-6
+        if (self.stop_event and self.stop_event.is_set()) or elapsed >= self.hard_limit \
+            or (self.node_limit and nodes >= self.node_limit):
+            self.stopped = True
+
+        last_time, last_nodes = self.last_check
+        interval = int((nodes - last_nodes) / ((now - last_time) * 10**-6) * control_poll_time) if now > last_time else 1
+        self.last_check = (now, nodes)
+        self.next_check = nodes + max(1, min(interval, control_max_interval))
+        if self.node_limit:
+            self.next_check = min(self.next_check, self.node_limit)
+        return self.stopped
@@ -0,0 +1,383 @@
+"""
+Not Magnus
+Classical chess engine by Devin Zhang
+
+Fixed-size transposition table packed into a flat array of 64-bit words,
+and the pawn, evaluation, and perft hash tables
+"""
+from multiprocessing import shared_memory
+import chess
+
+
+# Entry flags
+EXACT = 0
+LOWERBOUND = 1
+UPPERBOUND = 2
+
+# Layout
+ENTRY_WORDS = 2 # Each entry is (key ^ data, data)
+BUCKET_SLOTS = 2 # Slot 0 is depth-preferred, slot 1 is always-replace
+BUCKET_WORDS = ENTRY_WORDS * BUCKET_SLOTS
+BUCKET_BYTES = BUCKET_WORDS * 8
+
+KEY_MASK = 0xFFFFFFFFFFFFFFFF
+SCORE_OFFSET = 1 << 31
+SCORE_LIMIT = (1 << 31) - 1
+GENERATION_MASK = 0x3F
+
+
+def encode_move(move):
+    """
+    Packs a move into 16 bits (from square, to square, promotion piece)
+    The null move and no move are both stored as 0
+    """
+    if not move:
+        return 0
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def decode_move(code):
+    """
+    Unpacks a 16 bit move created by encode_move()
+    """
+    if not code:
+        return None
+    return chess.Move(code & 0x3F, (code >> 6) & 0x3F, (code >> 12) or None)
+
+
+class TranspositionTable:
+    """
+    Transposition table with a fixed memory budget
+
+    The table is a preallocated array of unsigned 64-bit words split into buckets of two entries.
+    An entry is two words, the key XORed with the data and the data itself, so that a torn write
+    (Hyatt and Mann's lockless technique) is detected as a miss instead of returning bad data.
+    This makes it safe to place the table in shared memory and have several search processes
+    read and write it at the same time without locks (see share() and attach()).
+
+    Data word layout:
+    - Bits 0-15: best move
+    - Bits 16-23: depth
+    - Bits 24-25: flag (EXACT, LOWERBOUND, UPPERBOUND)
+    - Bits 26-31: generation, the search the entry was written in
+    - Bits 32-63: score, offset to be unsigned
+
+    Replacement policy per bucket:
+    - Slot 0 keeps the deepest entry, and is only replaced by the same position, an equal or deeper
+      search, or an entry left over from an older search (generation aging)
+    - Slot 1 is always replaced by anything that does not qualify for slot 0
+    """
+
+    def __init__(self, size_mb = 16):
+        self.table = None
+        self.memory = None # Byte view of the table
+        self.shm = None # Shared memory block holding the table, if shared
+        self.shm_owner = False
+        self.size_mb = 0
+        self.buckets = 0
+        self.generation = 0
+        self.resize(size_mb)
+
+    def _allocate(self, size_mb, shm_name = None, create_shm = False):
+        """
+        Points the table at a new block of memory: private, a new shared memory block,
+        or an existing shared memory block created by another process
+        """
+        self.release()
+        self.size_mb = int(size_mb)
+        self.buckets = max(1, (self.size_mb * 1024 * 1024) // BUCKET_BYTES)
+        size = self.buckets * BUCKET_BYTES
+        if create_shm:
+            self.shm = shared_memory.SharedMemory(create = True, size = size)
+            self.shm_owner = True
+            buffer = self.shm.buf
+        elif shm_name:
+            self.shm = shared_memory.SharedMemory(name = shm_name)
+            buffer = self.shm.buf
+        else:
+            buffer = bytearray(size)
+        self.memory = memoryview(buffer)[:size]
+        self.table = self.memory.cast("Q")
+        self.generation = 0
+
+    def resize(self, size_mb):
+        """
+        Reallocates the table to use size_mb megabytes, which clears it
+        Stays in shared memory if it was shared
+        """
+        if self.shm_owner:
+            self._allocate(size_mb, create_shm = True)
+        else:
+            self._allocate(size_mb)
+
+    def share(self):
+        """
+        Moves the table into a new shared memory block, keeping its entries
+        Returns the name of the block for other processes to attach()
+        """
+        if not self.shm_owner:
+            entries = bytes(self.memory)
+            self._allocate(self.size_mb, create_shm = True)
+            self.memory[:] = entries
+        return self.shm.name
+
+    def attach(self, shm_name, size_mb):
+        """
+        Uses the shared memory block created by share() in another process
+        """
+        self.shm_owner = False # A forked process inherits the owner's table, which must not be unlinked here
+        self._allocate(size_mb, shm_name = shm_name)
+
+    def release(self):
+        """
+        Frees the memory of the table, unlinking the shared memory block if this process created it
+        """
+        if self.table is not None:
+            self.table.release()
+            self.memory.release()
+            self.table = None
+            self.memory = None
+        if self.shm:
+            self.shm.close()
+            if self.shm_owner:
+                self.shm.unlink()
+            self.shm = None
+            self.shm_owner = False
+
+    def clear(self):
+        """
+        Empties every entry without reallocating
+        """
+        self.memory[:] = bytes(len(self.memory))
+        self.generation = 0
+
+    def new_search(self):
+        """
+        Ages the table, entries from previous searches become preferred for replacement
+        """
+        self.generation = (self.generation + 1) & GENERATION_MASK
+
+    def probe(self, key):
+        """
+        Returns (depth, move, score, flag) stored for the position key, or None if not found
+        """
+        table = self.table
+        index = (key % self.buckets) * BUCKET_WORDS
+        for i in (index, index + ENTRY_WORDS):
+            data = table[i + 1]
+            if table[i] ^ data == key and data:
+                return ((data >> 16) & 0xFF, decode_move(data & 0xFFFF), (data >> 32) - SCORE_OFFSET, (data >> 24) & 0x3)
+        return None
+
+    def store(self, key, depth, move, score, flag):
+        """
+        Saves a search result for the position key following the replacement policy
+        """
+        table = self.table
+        index = (key % self.buckets) * BUCKET_WORDS
+
+        score = int(max(-SCORE_LIMIT, min(SCORE_LIMIT, score)))
+        depth = max(0, min(0xFF, depth))
+        code = encode_move(move)
+
+        # Choose the slot, a slot already holding the position is always reused so it is never in both
+        old_data = table[index + 1]
+        old_key = table[index] ^ old_data
+        second_data = table[index + ENTRY_WORDS + 1]
+        second_key = table[index + ENTRY_WORDS] ^ second_data
+        if old_key != key and (second_key == key or (depth < (old_data >> 16) & 0xFF and (old_data >> 26) & GENERATION_MASK == self.generation)):
+            i = index + ENTRY_WORDS
+            old_data = second_data
+            old_key = second_key
+        else:
+            i = index
+
+        # Keep the previous best move if this search did not find one for the same position
+        if not code and old_key == key:
+            code = old_data & 0xFFFF
+
+        data = code | (depth << 16) | (flag << 24) | (self.generation << 26) | ((score + SCORE_OFFSET) << 32)
+        table[i] = key ^ data
+        table[i + 1] = data
+
+    def hashfull(self):
+        """
+        Returns the permill of slots used by the current search, sampled from the first 1000 buckets
+        """
+        table = self.table
+        sample = min(1000, self.buckets)
+        used = 0
+        for bucket in range(sample):
+            for i in (bucket * BUCKET_WORDS, bucket * BUCKET_WORDS + ENTRY_WORDS):
+                data = table[i + 1]
+                if data and (data >> 26) & GENERATION_MASK == self.generation:
+                    used += 1
+        return used * 1000 // (sample * BUCKET_SLOTS)
+
+
+class PawnHashTable:
+    """
+    Fixed-size table of pawn structure evaluations indexed by the pawn-only Zobrist key
+
+    Each entry is a tuple of (key, middlegame score, endgame score, passed pawns, half-open files),
+    where scores are from white's point of view and the bitboards are indexed by [color].
+    Half-open files of a color are the files without any of that color's pawns, so files half-open
+    for both colors are open. A new entry always replaces the old one in its slot.
+    The hits and misses counters are kept so the size can be tuned.
+    """
+
+    def __init__(self, entries = 1 << 14):
+        self.resize(entries)
+
+    def resize(self, entries):
+        """
+        Reallocates the table to hold entries (rounded down to a power of 2), which clears it
+        """
+        self.mask = (1 << (max(1, int(entries)).bit_length() - 1)) - 1
+        self.table = [None] * (self.mask + 1)
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        """
+        Empties every entry and resets the counters
+        """
+        self.resize(len(self.table))
+
+    def probe(self, key):
+        """
+        Returns the entry stored for the pawn key, or None if not found
+        """
+        entry = self.table[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, mg_score, eg_score, passed_pawns, half_open_files):
+        """
+        Saves the pawn structure evaluation for the pawn key, returns the new entry
+        """
+        entry = (key, mg_score, eg_score, passed_pawns, half_open_files)
+        self.table[key & self.mask] = entry
+        return entry
+
+    def hit_rate(self):
+        """
+        Returns the fraction of probes that found their entry
+        """
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0
+
+
+class EvalHashTable:
+    """
+    Fixed-size table of static evaluations indexed by the position's Zobrist key
+
+    Keys and scores are kept in two parallel lists so a store does not allocate an entry.
+    Scores are from the point of view of the side to move, which the key includes.
+    A new entry always replaces the old one in its slot.
+    """
+
+    def __init__(self, entries = 1 << 16):
+        self.resize(entries)
+
+    def resize(self, entries):
+        """
+        Reallocates the table to hold entries (rounded down to a power of 2), which clears it
+        """
+        self.mask = (1 << (max(1, int(entries)).bit_length() - 1)) - 1
+        self.keys = [None] * (self.mask + 1)
+        self.scores = [0] * (self.mask + 1)
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        """
+        Empties every entry and resets the counters
+        """
+        self.resize(len(self.keys))
+
+    def probe(self, key):
+        """
+        Returns the score stored for the position key, or None if not found
+        """
+        index = key & self.mask
+        if self.keys[index] == key:
+            self.hits += 1
+            return self.scores[index]
+        self.misses += 1
+        return None
+
+    def store(self, key, score):
+        """
+        Saves the static evaluation of the position key
+        """
+        index = key & self.mask
+        self.keys[index] = key
+        self.scores[index] = score
+
+    def hit_rate(self):
+        """
+        Returns the fraction of probes that found their entry
+        """
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0
+
+
+class PerftHashTable:
+    """
+    Fixed-size table of perft leaf counts indexed by the position's Zobrist key and the depth
+
+    Keys, depths, and counts are kept in three parallel lists. The key includes the side to move, castling
+    rights, and an en passant square only when the capture is possible, which is all a leaf count depends on.
+    A new entry always replaces the old one in its slot.
+    """
+
+    def __init__(self, entries = 1 << 16):
+        self.resize(entries)
+
+    def resize(self, entries):
+        """
+        Reallocates the table to hold entries (rounded down to a power of 2), which clears it
+        """
+        self.mask = (1 << (max(1, int(entries)).bit_length() - 1)) - 1
+        self.keys = [None] * (self.mask + 1)
+        self.depths = [0] * (self.mask + 1)
+        self.counts = [0] * (self.mask + 1)
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        """
+        Empties every entry and resets the counters
+        """
+        self.resize(len(self.keys))
+
+    def probe(self, key, depth):
+        """
+        Returns the leaf count stored for the position key at the depth, or None if not found
+        """
+        index = (key ^ depth) & self.mask
+        if self.keys[index] == key and self.depths[index] == depth:
+            self.hits += 1
+            return self.counts[index]
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, count):
+        """
+        Saves the leaf count of the position key at the depth
+        """
+        index = (key ^ depth) & self.mask
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.counts[index] = count
+
+    def hit_rate(self):
+        """
+        Returns the fraction of probes that found their entry
+        """
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0
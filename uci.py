@@ -3,60 +3,176 @@ Not Magnus
 Classical chess engine by Devin Zhang
 
 UCI communication file by Disservin
+
+The UCI loop runs on asyncio: stdin is read line by line on its own thread, the search runs on a
+worker thread, and every line for the GUI (including the search's info and bestmove lines) goes
+through one output queue written by a single task. Commands are handled while a search runs, so
+isready, stop, and quit are answered at once instead of after the search. Commands that change the
+engine's state (ucinewgame, setoption, go, bench) stop a running search first, so the loop is never
+left waiting on a search that only a later stop would end
 """
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from sys import stdout
-from threading import Thread
+from threading import Event
+import search
 from search import *
+from bench import BENCH_DEPTH, bench
+from perft import divide
+
+
+search_switch_interval = 0.0005 # Seconds the search thread may hold the interpreter before the UCI loop gets a turn
+
+
+async def write_output(output_queue):
+    """
+    Writes the queued output to stdout in order, the only place the UCI loop writes
+    """
+    while True:
+        text = await output_queue.get()
+        stdout.write(text)
+        stdout.flush()
+        output_queue.task_done()
+
 
+async def main():
+    loop = asyncio.get_running_loop()
+    output_queue = asyncio.Queue()
+    writer_task = asyncio.create_task(write_output(output_queue))
+    input_executor = ThreadPoolExecutor(max_workers = 1) # Blocks on stdin
+    search_executor = ThreadPoolExecutor(max_workers = 1) # Runs the search
+    search_future = None # Future of the running search
+    stop_event = Event() # Set to stop the running search
+    time_manager = None # Limits of the running search, kept to tell it about a ponderhit
+    evaluator_name = search.evaluator.name # Name and weights file of the evaluator in use
+    eval_file = ""
+    perft_hash = False # Use a perft hash table for go perft
+    sys.setswitchinterval(search_switch_interval)
+    set_output_writer(lambda text : loop.call_soon_threadsafe(output_queue.put_nowait, text))
 
-def main():
-    stack = []
-    out = stdout
-    stop_threads = False
-    
     def output(s):
-        out.write(str(s + "\n"))
-        out.flush()
-    
+        output_queue.put_nowait(str(s + "\n"))
+
+    async def wait_for_search(stop = False):
+        """
+        Waits for the running search to send its move, stopping it first if stop is true
+        """
+        if stop:
+            stop_event.set()
+        if search_future:
+            await asyncio.wrap_future(search_future)
+
     while True:
-        if stack:
-            command = stack.pop()
-        else:
-            command = input()
-        
+        line = await loop.run_in_executor(input_executor, sys.stdin.readline)
+        if not line: # End of input
+            line = "quit"
+        command = line.strip()
+
         if command == "quit":
+            await wait_for_search(stop = True)
+            stop_helpers()
+            ttable.release()
             break
         elif command == "stop":
-            stop_threads = True
-            try:
-                thread_main.join()
-            except:
-                pass
+            await wait_for_search(stop = True)
         elif command == "uci":
             output("id name Not Magnus")
             output("id auther Devin Zhang")
             output("")
-            output("option name openingbook type check default false")
-            output("option name tablebase type check default false")
+            output("option name Hash type spin default {} min 1 max 4096".format(HASH_SIZE))
+            output("option name Threads type spin default {} min 1 max 128".format(THREADS))
+            output("option name Ponder type check default false")
+            output("option name openingbook type check default {}".format(str(opening_book.enabled).lower()))
+            output("option name BookFile type string default {}".format(opening_book.location))
+            output("option name BookSelection type combo default {} var weighted var best".format(opening_book.selection))
+            output("option name BookDepth type spin default {} min 1 max 255".format(opening_book.max_depth))
+            output("option name tablebase type check default {}".format(str(tablebase.enabled).lower()))
+            output("option name GaviotaPath type string default {}".format(tablebase.location))
+            output("option name Evaluator type combo default {} {}".format(evaluator.name, " ".join("var " + name for name in evaluators)))
+            output("option name EvalFile type string default <empty>")
+            output("option name PerftHash type check default false")
             output("uciok")
         elif command == "isready":
             output("readyok")
+        elif command == "ponderhit":
+            if time_manager:
+                time_manager.ponderhit()
         elif command == "ucinewgame":
-            board = chess.Board()
+            await wait_for_search(stop = True)
+            board = Board()
             fen = board.fen()
+            ttable.clear()
+            clear_move_ordering()
+            search.evaluator.clear()
+        elif command.startswith("setoption"):
+            await wait_for_search(stop = True)
+            parameters = command.split(" ")
+            try:
+                name = " ".join(parameters[parameters.index("name") + 1:parameters.index("value")])
+                value = " ".join(parameters[parameters.index("value") + 1:])
+            except (ValueError, IndexError):
+                output("Invalid setoption command")
+                continue
+            if name.lower() == "hash":
+                try:
+                    size_mb = int(value)
+                except ValueError:
+                    output("Invalid setoption command")
+                    continue
+                ttable.resize(max(1, min(4096, size_mb)))
+                if helpers:
+                    start_helpers(len(helpers) + 1) # Helpers attach to the new table
+            elif name.lower() == "threads":
+                try:
+                    threads = int(value)
+                except ValueError:
+                    output("Invalid setoption command")
+                    continue
+                start_helpers(max(1, min(128, threads)))
+            elif name.lower() == "perfthash":
+                perft_hash = value.lower() == "true"
+            elif name.lower() == "openingbook":
+                opening_book.enabled = value.lower() == "true"
+            elif name.lower() == "bookfile":
+                opening_book.set_location(value)
+            elif name.lower() == "bookselection":
+                opening_book.selection = "best" if value.lower() == "best" else "weighted"
+            elif name.lower() == "bookdepth":
+                try:
+                    book_depth = int(value)
+                except ValueError:
+                    output("Invalid setoption command")
+                    continue
+                opening_book.max_depth = max(1, min(255, book_depth))
+            elif name.lower() in ("tablebase", "gaviotapath"):
+                if name.lower() == "tablebase":
+                    tablebase.enabled = value.lower() == "true"
+                else:
+                    tablebase.set_location(value)
+                if helpers:
+                    start_helpers(len(helpers) + 1) # Helpers get a copy of the tablebase settings
+            elif name.lower() in ("evaluator", "evalfile"):
+                new_evaluator_name = value.lower() if name.lower() == "evaluator" else evaluator_name
+                new_eval_file = ("" if value == "<empty>" else value) if name.lower() == "evalfile" else eval_file
+                try:
+                    set_evaluator(new_evaluator_name, new_eval_file or None)
+                except (KeyError, ImportError, OSError, ValueError) as error:
+                    output("info string Could not use evaluator {}: {}".format(new_evaluator_name, error))
+                    continue
+                evaluator_name, eval_file = new_evaluator_name, new_eval_file # Kept only once the switch worked
         elif command.startswith("position"):
-            stop_threads = False
             parameters = command.split(" ")
             fen_or_startpos = parameters[1]
             index_moves = command.find("moves")
             try:
                 if fen_or_startpos == "fen":
-                    board = chess.Board()
+                    board = Board()
                     index_fen = command.find("fen")
                     fen = command[(index_fen + 4):index_moves]
                     board.set_fen(fen)
                 elif fen_or_startpos == "startpos":
-                    board = chess.Board()
+                    board = Board()
                 else:
                     output("Invalid position command")
                 if "moves" in parameters:
@@ -65,39 +181,56 @@ def main():
                         board.push_uci(move)
             except UnboundLocalError:
                 output("Error: No board initialized")
+        elif command.startswith("bench"):
+            await wait_for_search(stop = True)
+            parameters = command.split(" ")
+            stop_event.clear()
+            try:
+                depth = int(parameters[1]) if len(parameters) > 1 else BENCH_DEPTH
+            except ValueError:
+                output("Invalid bench command")
+                continue
+            time_manager = None
+            search_future = search_executor.submit(bench, depth, stop_event)
         elif command.startswith("go"):
+            await wait_for_search(stop = True) # A GUI sends stop first, a search still running is stopped rather than waited for
             parameters = command.split(" ")
-            depth = 255
-            stop_threads = False
-            movetime = 5000 # TODO time manager
-            if "infinite" in parameters:
-                pass
-            elif "depth" in parameters:
-                depth = int(parameters[2])
-            elif "movetime" in parameters:
-                movetime = int(parameters[2])
-            elif "nodes" in parameters:
-                nodes = int(parameters[2])
-            elif "wtime" in parameters:
-                index_time = parameters.index("wtime")
-                wtime = int(parameters[index_time + 1])
-            elif "btime" in parameters:
-                index_time = parameters.index("btime")
-                btime = int(parameters[index_time + 1]) 
-            elif "winc" in parameters:
-                index_inc = parameters.index("winc")
-                winc = int(parameters[index_time + 1])
-            elif "binc" in parameters:
-                index_inc = parameters.index("binc")
-                binc = int(parameters[index_time + 1])
-            else:
-                depth = 255
+            stop_event.clear()
+            if "perft" in parameters: # go perft depth
+                try:
+                    depth = int(parameters[parameters.index("perft") + 1])
+                    time_manager = None
+                    search_future = search_executor.submit(divide, board, depth, PerftHashTable(PERFT_HASH_ENTRIES) if perft_hash else None, stop_event)
+                except (ValueError, IndexError):
+                    output("Invalid go command")
+                except UnboundLocalError:
+                    output("Error: No board initialized")
+                continue
+            limits = {}
+            try:
+                for limit in ("wtime", "btime", "winc", "binc", "movestogo", "movetime", "depth", "nodes", "mate"):
+                    if limit in parameters:
+                        limits[limit] = int(parameters[parameters.index(limit) + 1])
+            except (ValueError, IndexError): # Searching without the limit could run without a time limit
+                output("Invalid go command")
+                continue
+            depth = limits.pop("depth", 255)
             try:
-                thread_main = Thread(target = cpu_move, args = (board, depth, movetime, lambda: stop_threads))
-                thread_main.start()
+                time_manager = TimeManager(board.turn, ponder = "ponder" in parameters, **limits)
+                search_future = search_executor.submit(cpu_move, board, depth, INF, stop_event, time_manager)
             except UnboundLocalError:
                 output("Error: No board initialized")
-            
+
+    await output_queue.join() # Everything queued, including the last bestmove, is written before exiting
+    writer_task.cancel()
+    set_output_writer(None)
+    input_executor.shutdown(wait = False)
+    search_executor.shutdown()
+
 if __name__ == "__main__":
-    main()
-    
\ No newline at end of file
+    multiprocessing.freeze_support() # Needed for helper processes when frozen into an executable
+    if sys.argv[1:2] == ["bench"]: # python uci.py bench [depth]
+        bench(int(sys.argv[2]) if len(sys.argv) > 2 else BENCH_DEPTH)
+        ttable.release()
+    else:
+        asyncio.run(main())
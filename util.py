@@ -8,6 +8,10 @@ import time
 import chess
 import IPython.display
 from chess.svg import board
+from transposition import *
+from tablebase import *
+from book import *
+from see import *
 
 
 # Options
@@ -17,22 +21,81 @@ OPENING_BOOK = False # Use opening book?
 ENDGAME_BOOK = False # Use endgame book?
 OPENING_BOOK_LOCATION = "Opening Book/Book.bin"
 ENDGAME_BOOK_LOCATION = "Endgame Book"
+BOOK_SELECTION = "weighted" # How book moves are picked: "weighted" (random, in proportion to their weights) or "best"
+BOOK_DEPTH = 20 # Moves into the game the opening book is used for
+HASH_SIZE = 16 # Transposition table size in megabytes
+THREADS = 1 # Number of search processes, more than 1 uses Lazy SMP
+PAWN_HASH_ENTRIES = 1 << 14 # Pawn hash table size in entries
+EVAL_HASH_ENTRIES = 1 << 16 # Evaluation hash table size in entries
+TABLEBASE_CACHE_ENTRIES = 1 << 16 # Endgame tablebase probe cache size in positions
+PERFT_HASH_ENTRIES = 1 << 18 # Perft hash table size in entries, used by perft with the hash turned on
 
 # Constants
 INF = float("inf")
 MATE_SCORE = 99999
+MAX_PLY = 128 # Deepest ply the search tables are sized for
 
 # Tables
-ttable = {} # Transposition table
+ttable = TranspositionTable(HASH_SIZE) # Transposition table, kept between moves
 htable = [[[0 for x in range(64)] for y in range(64)] for z in range(2)] # History heuristic table [side to move][move from][move to]
-rtable = {} # Draw by repetition table
-pawn_hash_table = {} # Transposition table just for pawn scoring
+ktable = [[None, None] for x in range(MAX_PLY)] # Killer moves table [ply][slot]
+pv_table = [[] for x in range(MAX_PLY)] # Triangular principal variation table, row [ply] is the best line from that ply on
+pawn_hash_table = PawnHashTable(PAWN_HASH_ENTRIES) # Pawn structure evaluations, kept between moves
+eval_hash_table = EvalHashTable(EVAL_HASH_ENTRIES) # Static evaluations, kept between moves
+opening_book = OpeningBook(OPENING_BOOK_LOCATION, OPENING_BOOK, BOOK_SELECTION, BOOK_DEPTH) # Opening book, kept mapped between moves
+tablebase = Tablebase(ENDGAME_BOOK_LOCATION, ENDGAME_BOOK, TABLEBASE_CACHE_ENTRIES) # Endgame tablebase and its probe cache, kept open between moves
 
 # UCI
 nodes = 0 # Number of positions considered
 start_time = 0 # Time search is started
 
 
+class MoveContext:
+    """
+    Legal moves and check status of a single node, generated at most once
+    and shared by the search, evaluation, and move ordering at that node
+    """
+
+    def __init__(self, board):
+        self.board = board
+        self.in_check = board.is_check()
+        self.enemies = board.occupied_co[not board.turn]
+        self._moves = None
+        self._has_moves = None
+
+    @property
+    def moves(self):
+        """
+        List of legal moves, generated on first use
+        """
+        if self._moves is None:
+            self._moves = list(self.board.generate_legal_moves())
+            self._has_moves = bool(self._moves)
+        return self._moves
+
+    def has_moves(self):
+        """
+        Returns true if there is at least one legal move, without generating
+        the full list if it has not been generated yet
+        The answer is kept, so the moves are looked for at most once per node
+        """
+        if self._has_moves is None:
+            self._has_moves = any(self.board.generate_legal_moves())
+        return self._has_moves
+
+    def is_checkmate(self):
+        return self.in_check and not self.has_moves()
+
+    def is_stalemate(self):
+        return not self.in_check and not self.has_moves()
+
+    def is_capture(self, move):
+        """
+        Same as board.is_capture(), with the enemy pieces looked up once per node
+        """
+        return bool(self.enemies & chess.BB_SQUARES[move.to_square]) or self.board.is_en_passant(move)
+
+
 def display(board):
     """
     Clears cell and displays visual board
@@ -49,15 +112,14 @@ def display(board):
     IPython.display.display(chess.svg.board(board, orientation = orientation, lastmove = lastmove, size = 350))
 
 
-def rate(board, move, tt_move):
+def rate(board, move, tt_move, ctx = None):
     """
     Rates a move in relation to the following order for move ordering:
     - Refutation move (moves from transpositions) | score = 600
     - Winning captures (low value piece captures high value piece) | 100 <= score <= 500
     - Promotions / Equal captures (piece captured and capturing have the same value) | score = 0
-    - Killer moves (from history heuristic table) | -100 < score < 0
     - Losing captures (high value piece captures low value piece) | -500 <= score <= -100
-    - All others | score = -1000
+    - All others | score = -1000 + history heuristic score
 
     Pieces have the following values:
     - Pawn: 1
@@ -69,23 +131,139 @@ def rate(board, move, tt_move):
 
     Values are arbitrary, and only useful when comparing
     whether one is higher or lower than the other
+    The move picker only compares scores within a stage (captures or quiet moves)
     """
-    if tt_move:
+    if move == tt_move:
         return 600
 
-    if htable[board.piece_at(move.from_square).color][move.from_square][move.to_square] != 0:
-        return htable[board.piece_at(move.from_square).color][move.from_square][move.to_square] / -100
-
-    if board.is_capture(move):
+    if ctx.is_capture(move) if ctx else board.is_capture(move):
         if board.is_en_passant(move):
             return 0 # pawn value (1) - pawn value (1) = 0
         else:
-            return (board.piece_at(move.to_square).piece_type - board.piece_at(move.from_square).piece_type) * 100
+            return (board.piece_type_at(move.to_square) - board.piece_type_at(move.from_square)) * 100
 
     if move.promotion:
         return 0
 
-    return -1000
+    return -1000 + htable[board.turn][move.from_square][move.to_square]
+
+
+def mvv_lva(board, move):
+    """
+    Most valuable victim, least valuable attacker score of a capture or promotion
+    Captures are ordered by the piece captured first, then by the piece capturing
+    """
+    attacker = board.piece_type_at(move.from_square)
+    victim = board.piece_type_at(move.to_square) or (chess.PAWN if board.is_en_passant(move) else 0)
+    score = victim * 8 - attacker
+    if move.promotion:
+        score += move.promotion * 8
+    return score
+
+
+def generate_qsearch_captures(board):
+    """
+    Generates the captures and queen promotions searched by quiescence search, unordered
+    """
+    back_rank = chess.BB_RANK_8 if board.turn == chess.WHITE else chess.BB_RANK_1
+    moves = list(board.generate_legal_captures())
+    moves.extend(move for move in board.generate_legal_moves(board.pawns, back_rank & ~board.occupied) if move.promotion == chess.QUEEN)
+    return moves
+
+
+def generate_quiet_checks(board):
+    """
+    Generates the quiet moves that give check, searched by quiescence search after the captures
+    """
+    for move in board.generate_legal_moves(chess.BB_ALL, ~board.occupied_co[not board.turn] & chess.BB_ALL):
+        if not move.promotion and not board.is_en_passant(move) and board.gives_check(move):
+            yield move
+
+
+def pick_moves(board, ctx, tt_move, ply):
+    """
+    Generates the moves of a negamax node lazily in stages, so a node that
+    cuts off early never generates or rates the moves it does not search:
+    - Transposition table move, before any move generation
+    - Winning and equal captures, and queen promotions
+    - Killer moves
+    - Quiet moves ordered by history heuristic, picked one at a time by selection
+    - Losing captures
+
+    Moves are scored with rate(), captures are split into winning and losing by static exchange evaluation
+    """
+    if tt_move and board.is_legal(tt_move):
+        yield tt_move
+    else:
+        tt_move = None
+
+    # Captures
+    back_rank = chess.BB_RANK_8 if board.turn == chess.WHITE else chess.BB_RANK_1
+    captures = [(rate(board, move, None, ctx), move) for move in board.generate_legal_captures() if move != tt_move]
+    captures.extend((0, move) for move in board.generate_legal_moves(board.pawns, back_rank & ~board.occupied) \
+                    if move.promotion == chess.QUEEN and move != tt_move)
+    captures.sort(key = lambda scored : scored[0], reverse = True)
+    losing_captures = []
+    for score, move in captures:
+        if score < 0 and is_losing_capture(board, move):
+            losing_captures.append(move)
+        else:
+            yield move
+
+    # Killer moves
+    killers = [killer for killer in ktable[ply] if killer and killer != tt_move and not killer.promotion \
+               and not board.is_capture(killer) and board.is_legal(killer)]
+    yield from killers
+
+    # Quiet moves, selection sort so only the moves actually searched get sorted
+    quiets = [(rate(board, move, None, ctx), move) for move in board.generate_legal_moves(chess.BB_ALL, ~board.occupied_co[not board.turn] & chess.BB_ALL) \
+              if move.promotion != chess.QUEEN and not board.is_en_passant(move) and move != tt_move and move not in killers]
+    for i in range(len(quiets)):
+        best = i
+        for j in range(i + 1, len(quiets)):
+            if quiets[j][0] > quiets[best][0]:
+                best = j
+        quiets[i], quiets[best] = quiets[best], quiets[i]
+        yield quiets[i][1]
+
+    yield from losing_captures
+
+
+def update_killers(ply, move):
+    """
+    Saves a quiet move that caused a beta cut-off as a killer move for the ply
+    """
+    killers = ktable[ply]
+    if killers[0] != move:
+        killers[1] = killers[0]
+        killers[0] = move
+
+
+def clear_move_ordering():
+    """
+    Resets the history heuristic and killer move tables
+    """
+    for side in htable:
+        for from_square in side:
+            for to_square in range(64):
+                from_square[to_square] = 0
+    for killers in ktable:
+        killers[0] = None
+        killers[1] = None
+
+
+def age_move_ordering():
+    """
+    Halves the history heuristic scores and resets the killer moves between searches,
+    so the history learned on the previous move still orders the next search
+    """
+    for side in htable:
+        for from_square in side:
+            for to_square in range(64):
+                from_square[to_square] //= 2
+    for killers in ktable:
+        killers[0] = None
+        killers[1] = None
 
 
 def get_num_pieces(board):
@@ -95,18 +273,19 @@ def get_num_pieces(board):
     return len(chess.SquareSet(board.occupied))
 
 
-def null_move_ok(board):
+def null_move_ok(board, ctx = None):
     """
     Returns true if conditions are met to perform null move pruning
     Returns false if side to move is in check or too few pieces (indicator of endgame, more chance for zugzwang)
     """
     endgame_threshold = 14 # TODO adjust threshold
-    if (board.move_stack and board.peek() == chess.Move.null()) or board.is_check() or get_num_pieces(board) <= endgame_threshold:
+    in_check = ctx.in_check if ctx else board.is_check()
+    if (board.move_stack and board.peek() == chess.Move.null()) or in_check or get_num_pieces(board) <= endgame_threshold:
         return False
     return True
 
 
-def reduction_ok(board, depth, move, moves_searched, has_failed_high):
+def reduction_ok(board, depth, move, moves_searched, has_failed_high, ctx = None):
     """
     Returns true if conditions are met to perform late move reduction
     Returns false if move:
@@ -114,56 +293,53 @@ def reduction_ok(board, depth, move, moves_searched, has_failed_high):
     - is a promotion
     - gives check
     - is made while in check
+
+    Called after the move is pushed, ctx is the context of the node the move was made from
     """
     full_depth_moves_threshold = 4 # Minimum number of moves to search at full depth
     reduction_threshold = 3 # Maximum depth to reduce at
 
+    if moves_searched < full_depth_moves_threshold or has_failed_high == True or depth < reduction_threshold \
+        or move.promotion or board.is_check():
+        return False
+    if ctx:
+        return not (ctx.in_check or ctx.is_capture(move))
+
     result = True
     board.pop()
-    if moves_searched < full_depth_moves_threshold or has_failed_high == True or depth < reduction_threshold \
-        or board.is_capture(move) or move.promotion or board.gives_check(move) or board.is_check():
+    if board.is_capture(move) or board.is_check():
         result = False
     board.push(move)
     return result
 
 
-def uci_output(move, score, depth, nodes, time_search):
+def uci_output(pv, score, depth, nodes, time_search):
     """
     Print output about the search in UCI engine communication
+    pv is the list of moves in the principal variation
+    Mate scores are MATE_SCORE minus the plies to mate, and are given in moves
     """
     time_now = time.time_ns()
-    time_diff = time_now - time_search
-
-    try:
-        return "info depth {} score cp {} nodes {} nps {} time {} pv {} \n"\
-            .format(depth, int(score), nodes, int(nodes / (time_diff * 10**-9)), int(time_diff * 10**-6), move)
-    except ZeroDivisionError:
-        time_diff = 0.1
-        return "info depth {} score cp {} nodes {} nps {} time {} pv {} \n"\
-            .format(depth, int(score), nodes, int(nodes / (time_diff * 10**-9)), int(time_diff * 10**-6), move)
-
+    time_diff = max(time_now - time_search, 1)
+    pv_string = " ".join(str(move) for move in pv)
+    if abs(score) >= MATE_SCORE - MAX_PLY:
+        score_string = "mate {}".format((MATE_SCORE - int(score) + 1) // 2 if score > 0 else -((MATE_SCORE + int(score)) // 2))
+    else:
+        score_string = "cp {}".format(int(score))
 
-def can_exit_search(movetime, stop, start_time):
-    """
-    Returns true if stop command given or too much time elapsed on search
-    """
-    if stop() or (movetime - (time.time_ns() - start_time) * 10**-6) <= 0:
-        return True
-    return False
+    return "info depth {} score {} nodes {} nps {} time {} hashfull {} pv {} \n"\
+        .format(depth, score_string, nodes, int(nodes / (time_diff * 10**-9)), int(time_diff * 10**-6), ttable.hashfull(), pv_string)
 
 
 def is_threefold_repetition(board):
     """
-    Checks if the game is over by threefold repetition
+    Checks if the game is over by threefold repetition, using the
+    position keys on the board's stack back to the last irreversible move
     """
-    key = board._transposition_key()
-    if key in rtable:
-        if rtable[key] >= 3:
-            return True
-    return False
+    return board.is_repetition_draw()
 
 
-def get_game_state(board):
+def get_game_state(board, ctx = None):
     """
     Returns a number based on how the game has ended:
     - Game not ended: 0
@@ -173,9 +349,11 @@ def get_game_state(board):
     - Draw (by fifty-move rule): 4
     - Draw (by insufficient material): 5
     """
-    if board.is_checkmate():
+    if not ctx:
+        ctx = MoveContext(board)
+    if ctx.is_checkmate():
         return 1
-    if board.is_stalemate():
+    if ctx.is_stalemate():
         return 2
     if is_threefold_repetition(board):
         return 3
@@ -191,14 +369,14 @@ def count_bin(num):
     Given an integer, return how many 1s in that integer
     in binary form
     """
-    return bin(num).count("1")
+    return num.bit_count()
 
 
-def is_game_over(board):
+def is_game_over(board, ctx = None):
     """
     Checks if the game is over by checkmate, stalemate,
     threefold repetition, fifty-move rule, or insufficient material
     """
-    if get_game_state(board) == 0:
+    if get_game_state(board, ctx) == 0:
         return False
     return True